@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from enum import Enum, auto
 
 BASE_CAPACITY = 10
@@ -6,6 +7,12 @@ LOCATION_ROAD_TOWN = 4
 LOCATION_KILLING_FIELDS = 3
 LOCATION_ROAD_KILLING_FIELDS = 2
 LOCATION_TOWN = 1
+EXPERIENCE_PER_KILL = (3, 5)
+# A kill grants a random attribute only on the top roll of 1..ATTRIBUTE_ROLL.
+ATTRIBUTE_ROLL = 100
+# Item quality by the lowest roll of 1..ITEM_QUALITY_ROLL that yields it.
+ITEM_QUALITY_ROLL = 64
+ITEM_QUALITY_THRESHOLDS = ((64, 64), (60, 16), (48, 4), (1, 1))
 LUCK_MULTIPLIER = 0.1
 SPEED_OF_TRAVEL_MULTIPLIER = 0.1
 LIST_OF_ITEMS = [
@@ -18,6 +25,7 @@ LIST_OF_ITEMS = [
     "Head & Shoulders",
     "Bat",
 ]
+ATTRIBUTES = ["strength", "agility", "vitality", "wisdom", "charisma"]
 LIST_OF_MONSTER = [
     "Dragon",
     "ButterFly",
@@ -48,3 +56,28 @@ ACTION_SPEED = {
     ActionType.TRAVEL_TO_TOWN: 1,
     ActionType.TOWN: 60,
 }
+
+
+DIARY_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+EVENT_TRAVEL_TO_KILLING_FIELD = 1
+EVENT_KILLING_FIELD = 2
+EVENT_KILL_MONSTER = 3
+EVENT_ATTRIBUTE = 4
+EVENT_LOOT = 5
+EVENT_TRAVEL_TO_TOWN = 6
+EVENT_TOWN = 7
+EVENT_SELL_ITEM = 8
+EVENT_BUY_EQUIPMENT = 9
+EVENT_TRIPS = 10
+EVENT_TRIPS_EQUIPMENT = 11
+EVENT_SELL_STASH = 12
+
+# Actions that only move the hero: the location they lead to and the diary event they log.
+MOVES = {
+    ActionType.TRAVEL_TO_KILLING_FIELD: (LOCATION_ROAD_KILLING_FIELDS, EVENT_TRAVEL_TO_KILLING_FIELD),
+    ActionType.KILLING_FIELD: (LOCATION_KILLING_FIELDS, EVENT_KILLING_FIELD),
+    ActionType.TRAVEL_TO_TOWN: (LOCATION_ROAD_TOWN, EVENT_TRAVEL_TO_TOWN),
+    ActionType.TOWN: (LOCATION_TOWN, EVENT_TOWN),
+}
+# The next action on a road only depends on the location; anywhere unknown leads back to town.
+ROAD_ACTIONS = {LOCATION_ROAD_KILLING_FIELDS: ActionType.KILLING_FIELD, LOCATION_ROAD_TOWN: ActionType.TOWN}
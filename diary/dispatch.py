@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+from django.conf import settings
+from django.db import close_old_connections
+from rq import Queue
+from rq.utils import import_attribute
+
+from diary.shards import RingCache
+
+logger = logging.getLogger(__name__)
+
+
+def run_job(func, args, kwargs):
+    if isinstance(func, str):
+        func = import_attribute(func)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+class LocalDispatcher:
+    """Runs jobs in a small in-process thread pool, for development or when Redis is down."""
+
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="diary-jobs")
+
+    def dispatch(self, func, *args, queue_name: str = "default", **kwargs):
+        return self._executor.submit(run_job, func, args, kwargs)
+
+    def hero_queue(self, hero_id: int, priority: str) -> str:
+        return priority
+
+
+class RedisDispatcher:
+    """Enqueues jobs on rq queues, falling back to local execution when Redis fails."""
+
+    def __init__(self, connection: redis.Redis, fallback=None):
+        self.connection = connection
+        self._queues = {}
+        self._fallback = fallback or LocalDispatcher()
+        self._ring = RingCache(connection)
+
+    def queue(self, name: str) -> Queue:
+        if name not in self._queues:
+            self._queues[name] = Queue(name, connection=self.connection)
+        return self._queues[name]
+
+    def hero_queue(self, hero_id: int, priority: str) -> str:
+        """The ``priority`` queue of the hero's shard, see diary.shards."""
+        try:
+            return self._ring.queue_for(hero_id, priority)
+        except redis.RedisError:
+            return priority
+
+    def dispatch(self, func, *args, queue_name: str = "default", **kwargs):
+        try:
+            return self.queue(queue_name).enqueue(func, *args, **kwargs)
+        except redis.RedisError:
+            logger.warning("Redis unavailable, running %s locally", func, exc_info=True)
+            return self._fallback.dispatch(func, *args, **kwargs)
+
+
+class BatchingDispatcher(RedisDispatcher):
+    """Fire-and-forget dispatch: jobs are buffered and enqueued in batches from a background thread."""
+
+    def __init__(self, connection: redis.Redis, fallback=None, batch_size: int = 50, flush_interval: float = 0.05):
+        super().__init__(connection, fallback)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def dispatch(self, func, *args, queue_name: str = "default", **kwargs):
+        self._pending.put((queue_name, func, args, kwargs))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="diary-dispatch", daemon=True)
+                    self._thread.start()
+
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        self.enqueue_batch(batch)
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._pending.get(timeout=self.flush_interval))
+                except queue.Empty:
+                    break
+            self.enqueue_batch(batch)
+
+    def enqueue_batch(self, batch):
+        jobs = defaultdict(list)
+        for queue_name, func, args, kwargs in batch:
+            jobs[queue_name].append((func, args, kwargs))
+        for queue_name, queued in jobs.items():
+            try:
+                self.queue(queue_name).enqueue_many(
+                    [Queue.prepare_data(func, args, kwargs) for func, args, kwargs in queued]
+                )
+            except redis.RedisError:
+                logger.warning("Redis unavailable, running %s jobs locally", len(queued), exc_info=True)
+                for func, args, kwargs in queued:
+                    self._fallback.dispatch(func, *args, **kwargs)
+
+
+def dispatch_connection() -> redis.Redis:
+    from worker import redis_url
+
+    pool = redis.ConnectionPool.from_url(
+        redis_url,
+        max_connections=settings.JOB_DISPATCH_MAX_CONNECTIONS,
+        socket_timeout=settings.JOB_DISPATCH_TIMEOUT,
+        socket_connect_timeout=settings.JOB_DISPATCH_TIMEOUT,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        if settings.JOB_DISPATCHER == "local":
+            _dispatcher = LocalDispatcher()
+        elif settings.JOB_DISPATCHER == "redis":
+            _dispatcher = RedisDispatcher(dispatch_connection())
+        else:
+            _dispatcher = BatchingDispatcher(dispatch_connection())
+    return _dispatcher
@@ -0,0 +1,56 @@
+"""Packed equipment storage: all nine slots of a hero in one fixed-width field on ``Hero``.
+
+Every slot takes ``SLOT_FORMAT``: prefix exponent + 1, suffix exponent + 1 (powers of 4, 0 marks
+an empty slot) and the modifier. ``DIARY_EQUIPMENT_STORAGE`` picks where HeroState writes the
+equipment; reading always prefers the packed field when a hero has one.
+"""
+
+import struct
+
+from django.conf import settings
+
+from diary import models
+
+SLOT_FORMAT = struct.Struct("<BBh")
+SLOTS = [slot for slot, _ in models.Equipment.SLOTS]
+
+
+def packed_storage() -> bool:
+    return settings.DIARY_EQUIPMENT_STORAGE == "packed"
+
+
+def exponent(value: int) -> int:
+    return value.bit_length() // 2  # 4 ** k has 2k + 1 bits
+
+
+def pack(equipments) -> bytes:
+    data = bytearray()
+    for slot in SLOTS:
+        equipment = equipments.get(slot)
+        if equipment is None:
+            data += SLOT_FORMAT.pack(0, 0, 0)
+        else:
+            data += SLOT_FORMAT.pack(exponent(equipment.prefix) + 1, exponent(equipment.suffix) + 1, equipment.modifier)
+    return bytes(data)
+
+
+def unpack(hero: models.Hero, data) -> dict:
+    equipments = {}
+    for slot, (prefix, suffix, modifier) in zip(SLOTS, SLOT_FORMAT.iter_unpack(bytes(data))):
+        if prefix:
+            equipments[slot] = models.Equipment(
+                owner=hero, slot=slot, prefix=4 ** (prefix - 1), suffix=4 ** (suffix - 1), modifier=modifier
+            )
+    return equipments
+
+
+def load_equipments(hero: models.Hero) -> dict:
+    if hero.equipment_packed is not None:
+        return unpack(hero, hero.equipment_packed)
+    return {equipment.slot: equipment for equipment in hero.equipments.all()}
+
+
+async def aload_equipments(hero: models.Hero) -> dict:
+    if hero.equipment_packed is not None:
+        return unpack(hero, hero.equipment_packed)
+    return {equipment.slot: equipment async for equipment in hero.equipments.all()}
@@ -0,0 +1,141 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from diary import consts, models
+from diary.rng import cumulative
+from diary.state import HeroState
+
+ATTRIBUTE_ROLLS = (False, True)
+ATTRIBUTE_ROLL_CUM_WEIGHTS = cumulative((consts.ATTRIBUTE_ROLL - 1, 1))
+
+
+def item_quality_weights():
+    qualities, weights = [], []
+    upper = consts.ITEM_QUALITY_ROLL + 1
+    for min_roll, quality in consts.ITEM_QUALITY_THRESHOLDS:
+        qualities.append(quality)
+        weights.append(upper - min_roll)
+        upper = min_roll
+    return tuple(qualities), cumulative(weights)
+
+
+ITEM_QUALITIES, ITEM_QUALITY_CUM_WEIGHTS = item_quality_weights()
+HERO_FIELDS = (
+    "experience",
+    "strength",
+    "agility",
+    "vitality",
+    "wisdom",
+    "charisma",
+    "level",
+    "capacity",
+    "speed_of_travel",
+    "luck",
+    "merchant_discount",
+    "gold",
+    "last_action",
+    "rng_position",
+)
+
+
+def seconds(action_type: consts.ActionType) -> timedelta:
+    return timedelta(seconds=consts.ACTION_SPEED[action_type])
+
+
+def upgrade_price(slot, equipment):
+    if slot not in equipment:
+        return 1
+    prefix, suffix = equipment[slot]
+    return models.Equipment.upgrade_price(prefix, suffix, slot)
+
+
+def upgrade(slot, equipment):
+    if slot not in equipment:
+        equipment[slot] = (1, 1)
+        return
+    prefix, suffix = equipment[slot]
+    if prefix > suffix:
+        equipment[slot] = (prefix, suffix * 4)
+    else:
+        equipment[slot] = (prefix * 4, suffix)
+
+
+class FastForward:
+    """Resolves whole town -> killing fields -> town trips in aggregate.
+
+    A trip starts in town with an empty stash and nothing affordable to buy, which is exactly
+    the state in which Diary predicts TRAVEL_TO_KILLING_FIELD, and ends in the same state.
+    Only the hero instance and an in-memory copy of the equipment are touched while running.
+    """
+
+    def __init__(self, state: HeroState):
+        self._state = state
+        self._hero = state.hero
+        self.equipment = {slot: (equipment.prefix, equipment.suffix) for slot, equipment in state.equipments.items()}
+        self.cycles = 0
+        self.kills = 0
+        self.gold_earned = 0
+        self.bought = 0
+        self.attributes = Counter()
+
+    def run(self, until, deadline=None):
+        while deadline is None or time.monotonic() < deadline:
+            snapshot = {field: getattr(self._hero, field) for field in HERO_FIELDS}
+            equipment = dict(self.equipment)
+            stats = self.run_cycle(equipment)
+            if self._hero.last_action >= until:
+                for field, value in snapshot.items():
+                    setattr(self._hero, field, value)
+                return self.cycles
+            self.equipment = equipment
+            self.cycles += 1
+            self.kills += stats["kills"]
+            self.gold_earned += stats["gold"]
+            self.bought += stats["bought"]
+            self.attributes.update(stats["attributes"])
+        return self.cycles
+
+    def run_cycle(self, equipment):
+        hero = self._hero
+        rng = hero.rng
+        low, high = consts.EXPERIENCE_PER_KILL
+        hero.last_action += seconds(consts.ActionType.TRAVEL_TO_KILLING_FIELD)
+        hero.last_action += seconds(consts.ActionType.KILLING_FIELD)
+
+        qualities = []
+        attributes = Counter()
+        while len(qualities) < hero.capacity:
+            kills = hero.capacity - len(qualities)
+            hero.gain_experience(low * kills + sum(rng.below_many(high - low + 1, kills)))
+            hero.last_action += seconds(consts.ActionType.KILL_MONSTER) * kills
+            for _ in range(rng.choices(ATTRIBUTE_ROLLS, ATTRIBUTE_ROLL_CUM_WEIGHTS, k=kills).count(True)):
+                attributes[hero.add_random_attribute()] += 1
+            qualities += rng.choices(ITEM_QUALITIES, ITEM_QUALITY_CUM_WEIGHTS, k=kills)
+
+        hero.last_action += seconds(consts.ActionType.TRAVEL_TO_TOWN)
+        hero.last_action += seconds(consts.ActionType.TOWN)
+
+        gold = hero.level * sum(qualities)
+        hero.gold += gold
+        hero.last_action += seconds(consts.ActionType.SELL_ITEM) * len(qualities)
+
+        bought = 0
+        while True:
+            prices = {slot: upgrade_price(slot, equipment) for slot, _ in models.Equipment.SLOTS}
+            if all(value > hero.gold for value in prices.values()):
+                break
+            for slot, value in prices.items():
+                if value <= hero.gold:
+                    hero.gold -= value
+                    upgrade(slot, equipment)
+                    hero.last_action += seconds(consts.ActionType.BUY_EQUIPMENT)
+                    bought += 1
+
+        return {"kills": len(qualities), "gold": gold, "bought": bought, "attributes": attributes}
+
+    def apply_equipment(self):
+        for slot, (prefix, suffix) in self.equipment.items():
+            equipment = self._state.equipments.get(slot)
+            if equipment is None or (equipment.prefix, equipment.suffix) != (prefix, suffix):
+                self._state.set_equipment(slot, prefix, suffix)
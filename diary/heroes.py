@@ -0,0 +1,118 @@
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from random import randint
+
+from django.db import transaction
+
+from diary import consts, models
+
+NAME_LOCALES = ["pl_PL", "sv_SE", "hi_IN"]
+CHUNK_SIZE = 10000
+BATCH_SIZE = 1000
+
+_fake = None
+_fake_lock = threading.Lock()
+_generate_lock = threading.Lock()
+
+
+def new_fake(seed=None):
+    from faker import Faker
+
+    fake = Faker(NAME_LOCALES)
+    if seed is not None:
+        fake.seed_instance(seed)
+    return fake
+
+
+def get_fake():
+    # Faker takes longer to import and build than the rest of the app, so only on first use.
+    global _fake
+    if _fake is None:
+        with _fake_lock:
+            if _fake is None:
+                _fake = new_fake()
+    return _fake
+
+
+def generate_names(count: int) -> list:
+    # Faker is not thread-safe and the pool refills on its own thread while requests take names.
+    fake = get_fake()
+    with _generate_lock:
+        return [fake.name() for _ in range(count)]
+
+
+class NamePool:
+    """Names generated ahead of use; a background thread refills the pool once it runs low."""
+
+    def __init__(self, size: int = 1000, low: int = 250):
+        self.size = size
+        self.low = low
+        self._names = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def take(self, count: int = 1) -> list:
+        names = []
+        while len(names) < count:
+            try:
+                names.append(self._names.popleft())
+            except IndexError:
+                names += generate_names(count - len(names))
+        if len(self._names) < self.low:
+            self.refill()
+        return names
+
+    def clear(self):
+        """Drop the names, e.g. in a forked process that must not repeat its parent's."""
+        self._names.clear()
+        self._refilling = False
+
+    def refill(self):
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name="diary-names", daemon=True).start()
+
+    def _refill(self):
+        try:
+            while len(self._names) < self.size:
+                self._names.extend(generate_names(min(100, self.size - len(self._names))))
+        finally:
+            self._refilling = False
+
+
+names = NamePool()
+
+
+def new_hero(name: str, last_action: datetime) -> models.Hero:
+    hero = models.Hero(
+        name=name,
+        gold=0,
+        last_action=last_action,
+        **{attribute: randint(3, 18) for attribute in consts.ATTRIBUTES},
+    )
+    hero.refresh_stats()  # bulk_create does not call save
+    return hero
+
+
+def create_chunk(count: int, batch_size: int = BATCH_SIZE) -> int:
+    new_names = names.take(count)
+    now = datetime.now(timezone.utc)
+    with transaction.atomic():
+        models.Hero.objects.bulk_create([new_hero(name, now) for name in new_names], batch_size=batch_size)
+    return count
+
+
+def chunks(count: int, chunk_size: int = CHUNK_SIZE):
+    for start in range(0, count, chunk_size):
+        yield min(chunk_size, count - start)
+
+
+def create_heroes(count: int, chunk_size: int = CHUNK_SIZE, batch_size: int = BATCH_SIZE):
+    """Create ``count`` heroes one chunk (one transaction) at a time, yielding the running total."""
+    created = 0
+    for size in chunks(count, chunk_size):
+        created += create_chunk(size, batch_size)
+        yield created
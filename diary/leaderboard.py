@@ -0,0 +1,58 @@
+"""Hero rankings, read from the ranking columns and indexes on ``Hero``.
+
+Every diary flush stores the hero's level and equipment score and offers the hero to the cached
+top lists with ``update``, so a ranking page is one cache read, or one indexed read of ``SIZE``
+rows once the cached list expired. Updates are read-modify-write on the cache: a flush racing
+another one in a different process can be lost, and is picked up again after ``TIMEOUT``.
+"""
+
+import bisect
+
+from django.core.cache import cache
+
+from diary import models
+
+BOARDS = {
+    "level": ("-level", "-experience", "id"),
+    "equipment": ("-equipment_score", "id"),
+}
+FIELDS = ("id", "name", "level", "experience", "equipment_score")
+SIZE = 100
+TIMEOUT = 5 * 60
+
+
+def leaderboard_key(board: str) -> str:
+    return f"leaderboard:{board}"
+
+
+def rank_key(board: str, entry: dict) -> tuple:
+    """Sorts the entries of a board best first."""
+    return tuple(-entry[field[1:]] if field.startswith("-") else entry[field] for field in BOARDS[board])
+
+
+def query(board: str, size: int = SIZE) -> list:
+    return list(models.Hero.objects.order_by(*BOARDS[board]).values(*FIELDS)[:size])
+
+
+def top(board: str, size: int = SIZE) -> list:
+    entries = cache.get(leaderboard_key(board))
+    if entries is None:
+        entries = query(board)
+        cache.set(leaderboard_key(board), entries, TIMEOUT)
+    return entries[:size]
+
+
+def update(hero: models.Hero):
+    """Move ``hero`` into the cached boards it now ranks on; boards that are not cached are left alone."""
+    entry = {field: getattr(hero, field) for field in FIELDS}
+    boards = cache.get_many([leaderboard_key(board) for board in BOARDS])
+    for board in BOARDS:
+        entries = boards.get(leaderboard_key(board))
+        if entries is None:
+            continue
+        key = rank_key(board, entry)
+        if len(entries) >= SIZE and key >= rank_key(board, entries[-1]):
+            continue
+        entries = [other for other in entries if other["id"] != hero.id]
+        bisect.insort(entries, entry, key=lambda other: rank_key(board, other))
+        cache.set(leaderboard_key(board), entries[:SIZE], TIMEOUT)
@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from diary import models
+from diary.management.commands.benchmark import percentile
+
+MODES = {"per request": 0, "persistent": None}
+
+
+class Command(BaseCommand):
+    help = (
+        "CheckHero latency with a new database connection per request and with a persistent one, "
+        "against the configured database. --connect-latency-ms adds a handshake like a remote database's."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--connect-latency-ms", type=float, default=0)
+
+    def handle(self, *args, **options):
+        hero = models.Hero.objects.order_by("id").first()
+        if hero is None:
+            raise CommandError("No heroes, create some with manage.py create_heroes")
+        url = reverse("hero", args=[hero.id])
+        latency = options["connect_latency_ms"] / 1000
+        connects = []
+
+        def connected(**kwargs):
+            connects.append(kwargs["connection"])
+            time.sleep(latency)
+
+        client = Client()
+        max_age = connection.settings_dict["CONN_MAX_AGE"]
+        connection_created.connect(connected)
+        try:
+            with override_settings(ALLOWED_HOSTS=["*"]):
+                client.get(url)  # fill the template and fragment caches
+                for name, mode_max_age in MODES.items():
+                    connection.settings_dict["CONN_MAX_AGE"] = mode_max_age
+                    connection.close()
+                    connects.clear()
+                    timings = []
+                    for _ in range(options["requests"]):
+                        start = time.perf_counter()
+                        # The test client leaves out what request_started and request_finished do.
+                        close_old_connections()
+                        response = client.get(url)
+                        close_old_connections()
+                        timings.append(time.perf_counter() - start)
+                        if response.status_code != 200:
+                            raise CommandError(f"{url} returned {response.status_code}")
+                    self.stdout.write(
+                        f"{name:<12} p50 {statistics.median(timings) * 1000:7.2f} ms  "
+                        f"p99 {percentile(timings, 0.99) * 1000:7.2f} ms  connections {len(connects)}"
+                    )
+        finally:
+            connection_created.disconnect(connected)
+            connection.settings_dict["CONN_MAX_AGE"] = max_age
+            connection.close()
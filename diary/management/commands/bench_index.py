@@ -0,0 +1,79 @@
+import statistics
+import time
+from datetime import datetime, timezone
+
+import fakeredis
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from rq import Queue
+
+from diary import models
+from diary.dispatch import BatchingDispatcher
+
+
+class SlowRedis(fakeredis.FakeStrictRedis):
+    """fakeredis with a fixed round-trip latency added to every command and pipeline."""
+
+    latency = 0.0
+
+    def execute_command(self, *args, **options):
+        time.sleep(self.latency)
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipeline = super().pipeline(transaction, shard_hint)
+        execute = pipeline.execute
+
+        def slow_execute(*args, **kwargs):
+            time.sleep(self.latency)
+            return execute(*args, **kwargs)
+
+        pipeline.execute = slow_execute
+        return pipeline
+
+
+class Command(BaseCommand):
+    help = "Index page latency with one background job per request, with and without Redis latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--heroes", type=int, default=30)
+        parser.add_argument("--latency-ms", type=float, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=["*"]):
+            for index in range(options["heroes"]):
+                models.Hero.objects.create(
+                    name=f"Bench {index}",
+                    strength=10,
+                    agility=10,
+                    vitality=10,
+                    wisdom=10,
+                    charisma=10,
+                    gold=0,
+                    last_action=datetime.now(timezone.utc),
+                )
+            for latency in (0.0, options["latency_ms"] / 1000):
+                connection = SlowRedis()
+                connection.latency = latency
+                enqueue = Queue(connection=connection).enqueue
+                self.report("sync enqueue", latency, options["requests"], enqueue)
+                dispatcher = BatchingDispatcher(connection)
+                self.report("batching dispatcher", latency, options["requests"], dispatcher.dispatch)
+            transaction.set_rollback(True)
+
+    def report(self, name, latency, requests, dispatch):
+        client = Client()
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            client.get("/")
+            dispatch("diary.tasks.advance_hero", 0)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{name:<20} redis latency {latency * 1000:>5.0f} ms  "
+            f"p50 {statistics.median(timings):7.2f} ms  p99 {timings[int(len(timings) * 0.99) - 1]:7.2f} ms"
+        )
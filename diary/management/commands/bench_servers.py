@@ -0,0 +1,102 @@
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diary import models
+from diary.management.commands.benchmark import percentile
+
+SERVERS = {
+    "wsgi": ["-m", "gunicorn", "--workers", "{workers}", "--threads", "4", "--bind", "127.0.0.1:{port}"]
+    + ["hero_diary.wsgi:application"],
+    "asgi": ["-m", "uvicorn", "--workers", "{workers}", "--port", "{port}", "--log-level", "warning"]
+    + ["hero_diary.asgi:application"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port: int, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError(f"Server on port {port} did not start")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the index and hero pages under gunicorn (WSGI) and uvicorn (ASGI, async views) "
+        "with the same number of worker processes, against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--duration", type=float, default=10)
+        parser.add_argument("--servers", nargs="+", choices=SERVERS, default=list(SERVERS))
+
+    def handle(self, *args, **options):
+        hero = models.Hero.objects.order_by("id").first()
+        if hero is None:
+            raise CommandError("No heroes, create some with manage.py create_heroes")
+        paths = ["/", f"/view_hero/{hero.id}"]
+        for name in options["servers"]:
+            port = free_port()
+            command = [sys.executable] + [arg.format(workers=options["workers"], port=port) for arg in SERVERS[name]]
+            server = subprocess.Popen(
+                command, cwd=settings.BASE_DIR, env=dict(os.environ, PYTHONPATH=settings.BASE_DIR)
+            )
+            try:
+                wait_for(port)
+                timings, errors = self.load(port, paths, options["concurrency"], options["duration"])
+            finally:
+                server.terminate()
+                server.wait()
+            if not timings:
+                raise CommandError(f"{name}: every request failed")
+            self.stdout.write(
+                f"{name}: {len(timings) / options['duration']:8.1f} req/s  "
+                f"p50 {statistics.median(timings) * 1000:7.1f} ms  p99 {percentile(timings, 0.99) * 1000:7.1f} ms  "
+                f"errors {errors}"
+            )
+
+    def load(self, port, paths, concurrency, duration):
+        timings, errors = [], []
+        deadline = time.monotonic() + duration
+
+        def client(index):
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            path = paths[index % len(paths)]
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    connection.request("GET", path)
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    ok = False
+                (timings if ok else errors).append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, len(errors)
@@ -0,0 +1,68 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Before Faker, redis and rq were loaded on first use: import ~230 ms, first request ~640 ms.
+TARGETS_MS = {"import_views": 50, "first_request": 500}
+
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+import diary.views
+imported = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+from hero_diary.wsgi import application
+environ = {}
+setup_testing_defaults(environ)
+status = []
+b"".join(application(environ, lambda response_status, headers: status.append(response_status)))
+first = time.perf_counter()
+print(json.dumps({
+    "setup": (setup - start) * 1000,
+    "import_views": (imported - setup) * 1000,
+    "first_request": (first - start) * 1000,
+    "status": status[0],
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Time `import diary.views` and process start to first index response in fresh interpreters, "
+        "against the targets in TARGETS_MS. Uses the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, PYTHONPATH=settings.BASE_DIR)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "hero_diary.settings")
+        runs = []
+        for _ in range(options["runs"]):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+            )
+            if output.returncode:
+                raise CommandError(output.stderr)
+            runs.append(json.loads(output.stdout.splitlines()[-1]))
+        if runs[0]["status"] != "200 OK":
+            raise CommandError(f"First request returned {runs[0]['status']}")
+
+        missed = []
+        for name in ("setup", "import_views", "first_request"):
+            median = statistics.median(run[name] for run in runs)
+            target = TARGETS_MS.get(name)
+            self.stdout.write(f"{name:<16} p50 {median:8.1f} ms" + (f"  target {target} ms" if target else ""))
+            if target and median > target:
+                missed.append(name)
+        if missed:
+            raise CommandError(f"Startup targets missed: {', '.join(missed)}")
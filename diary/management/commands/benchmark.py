@@ -0,0 +1,174 @@
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from diary import models
+from diary.heroes import new_fake
+from diary.views import Diary
+
+IDLE = {"1h": timedelta(hours=1), "1d": timedelta(days=1), "1w": timedelta(weeks=1)}
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def summarize(timings, queries, **extra):
+    result = {
+        "runs": len(timings),
+        "p50_ms": statistics.median(timings) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "queries": statistics.mean(queries),
+    }
+    result.update(extra)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark Diary.process_story and the hero views in a throwaway test database. "
+        "Point DATABASE_URL at a local Postgres to benchmark it instead of SQLite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="write results as JSON to this file")
+        parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+        parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as regression")
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        # Not the shared Faker behind heroes.names, whose pool is filled on another thread.
+        self.fake = new_fake(options["seed"])
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(ALLOWED_HOSTS=["*"], DEBUG=False):
+                results = self.run_benchmarks(options["runs"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "meta": {
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "seed": options["seed"],
+                "runs": options["runs"],
+            },
+            "results": results,
+        }
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<32} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+                f"queries {result['queries']:7.1f}"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+        if options["compare"]:
+            self.compare(options["compare"], results, options["threshold"])
+
+    def create_hero(self, idle: timedelta) -> models.Hero:
+        return models.Hero.objects.create(
+            name=self.fake.name(),
+            strength=random.randint(3, 18),
+            agility=random.randint(3, 18),
+            vitality=random.randint(3, 18),
+            wisdom=random.randint(3, 18),
+            charisma=random.randint(3, 18),
+            gold=0,
+            last_action=datetime.now(timezone.utc) - idle,
+        )
+
+    def run_benchmarks(self, runs):
+        results = {}
+        for mode, fast_forward in (("step", False), ("fast_forward", True)):
+            for label, idle in IDLE.items():
+                timings, queries, actions = [], [], []
+                for _ in range(runs):
+                    hero = self.create_hero(idle)
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        actions.append(Diary(hero, fast_forward=fast_forward).process_story())
+                        timings.append(time.perf_counter() - start)
+                    queries.append(len(context))
+                results[f"process_story_{mode}_{label}"] = summarize(
+                    timings,
+                    queries,
+                    actions=statistics.mean(actions),
+                    queries_per_action=sum(queries) / max(sum(actions), 1),
+                )
+
+        results["predict_action_x1000"] = self.measure_predictions(runs)
+
+        client = Client()
+        hero = self.create_hero(timedelta())
+        for _ in range(100):
+            self.create_hero(timedelta())
+        results["check_hero"] = self.measure_request(client, reverse("hero", args=[hero.id]), runs)
+        with override_settings(DIARY_ADVANCE_IN_REQUEST=True):
+            for label in ("1h", "1w"):
+                results[f"check_hero_advance_{label}"] = self.measure_request(
+                    client, reverse("hero", args=[hero.id]), runs, hero=hero, idle=IDLE[label]
+                )
+        results["start_view"] = self.measure_request(client, reverse("index"), runs)
+        return results
+
+    def measure_predictions(self, runs, steps=1000):
+        # One process_story step without the action itself: a fresh decision, then the memoized one.
+        diary = Diary(self.create_hero(IDLE["1d"]))
+        timings, queries = [], []
+        for _ in range(runs):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                for _ in range(steps):
+                    diary.state_changed()
+                    diary.can_do_next_action()
+                    diary.predict_action()
+                timings.append(time.perf_counter() - start)
+            queries.append(len(context))
+        return summarize(timings, queries, steps=steps)
+
+    def measure_request(self, client, url, runs, hero=None, idle=None):
+        timings, queries = [], []
+        for _ in range(runs):
+            if hero is not None:
+                models.Hero.objects.filter(pk=hero.pk).update(last_action=datetime.now(timezone.utc) - idle)
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError(f"{url} returned {response.status_code}")
+            queries.append(len(context))
+        return summarize(timings, queries)
+
+    def compare(self, path, results, threshold):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = 0
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            change = result["p50_ms"] / baseline[name]["p50_ms"] - 1
+            queries = result["queries"] - baseline[name]["queries"]
+            regression = change > threshold or queries >= 1
+            regressions += regression
+            self.stdout.write(
+                f"{name:<32} p50 {change:+7.1%}  queries {queries:+6.1f}{'  REGRESSION' if regression else ''}"
+            )
+        if regressions:
+            raise CommandError(f"{regressions} benchmark(s) regressed against {path}")
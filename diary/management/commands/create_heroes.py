@@ -0,0 +1,51 @@
+import random
+import time
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from diary import heroes
+
+
+def init_worker():
+    # Forked workers share the parent's random state and names and must not reuse its connection.
+    random.seed()
+    heroes.get_fake().seed_instance(random.getrandbits(32))
+    heroes.names.clear()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Create COUNT random heroes with bulk inserts, optionally in parallel worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("count", type=int)
+        parser.add_argument("--chunk-size", type=int, default=heroes.CHUNK_SIZE, help="heroes per transaction")
+        parser.add_argument("--batch-size", type=int, default=heroes.BATCH_SIZE, help="rows per INSERT")
+        parser.add_argument("--workers", type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options["count"] < 1 or options["chunk_size"] < 1 or options["workers"] < 1:
+            raise CommandError("count, --chunk-size and --workers must be positive")
+        if options["workers"] > 1 and connection.vendor == "sqlite":
+            raise CommandError("SQLite allows a single writer; use --workers 1 or point DATABASE_URL at Postgres")
+        start = time.perf_counter()
+        created = 0
+        for created in self.create(options):
+            self.stdout.write(f"{created}/{options['count']} heroes")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Created {created} heroes in {elapsed:.1f} s ({created / elapsed:.0f} heroes/s)")
+
+    def create(self, options):
+        if options["workers"] == 1:
+            yield from heroes.create_heroes(options["count"], options["chunk_size"], options["batch_size"])
+            return
+        connections.close_all()
+        sizes = heroes.chunks(options["count"], options["chunk_size"])
+        with get_context("fork").Pool(options["workers"], initializer=init_worker) as pool:
+            created = 0
+            jobs = [pool.apply_async(heroes.create_chunk, (size, options["batch_size"])) for size in sizes]
+            for job in jobs:
+                created += job.get()
+                yield created
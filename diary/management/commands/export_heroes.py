@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from diary import snapshot
+
+
+class Command(BaseCommand):
+    help = "Write every hero with stash and equipment to a snapshot file (gzip-compressed if it ends in .gz)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=snapshot.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = 0
+        with snapshot.open_snapshot(options["path"], "wb") as stream:
+            for written in snapshot.write_snapshot(stream, options["batch_size"]):
+                self.stdout.write(f"{written} heroes", ending="\r")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Exported {written} heroes in {elapsed:.1f} s")
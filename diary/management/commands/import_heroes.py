@@ -0,0 +1,37 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from diary import models, snapshot
+
+
+class Command(BaseCommand):
+    help = "Load heroes from a snapshot file written by export_heroes, one transaction per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=snapshot.BATCH_SIZE)
+        parser.add_argument("--keep-ids", action="store_true", help="keep hero ids, for cloning into an empty database")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        loaded = 0
+        with snapshot.open_snapshot(options["path"], "rb") as stream:
+            records = snapshot.read_heroes(stream, options["keep_ids"])
+            try:
+                while batch := list(islice(records, options["batch_size"])):
+                    with transaction.atomic():
+                        snapshot.load_batch(batch)
+                    loaded += len(batch)
+                    self.stdout.write(f"{loaded} heroes", ending="\r")
+            except snapshot.SnapshotError as error:
+                raise CommandError(f"{error} after {loaded} heroes")
+        if options["keep_ids"]:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [models.Hero]):
+                    cursor.execute(sql)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Imported {loaded} heroes in {elapsed:.1f} s")
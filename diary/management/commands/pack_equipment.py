@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from diary import models
+from diary.equipment import pack
+
+
+class Command(BaseCommand):
+    help = "Move Equipment rows into the packed Hero.equipment_packed field."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        heroes = models.Hero.objects.filter(equipment_packed__isnull=True).only("id", "version").order_by("id")
+        packed = skipped = 0
+        last_id = 0
+        while True:
+            batch = list(heroes.filter(id__gt=last_id).prefetch_related("equipments")[: options["batch_size"]])
+            if not batch:
+                break
+            with transaction.atomic():
+                moved = []
+                for hero in batch:
+                    # Like a diary flush: a run that loaded the hero before this one then gets a
+                    # StaleHeroError instead of writing its unpacked equipment back.
+                    value = pack({equipment.slot: equipment for equipment in hero.equipments.all()})
+                    if models.Hero.objects.filter(pk=hero.pk, version=hero.version).update(
+                        equipment_packed=value, version=F("version") + 1
+                    ):
+                        moved.append(hero.pk)
+                models.Equipment.objects.filter(owner__in=moved).delete()
+            packed += len(moved)
+            skipped += len(batch) - len(moved)
+            last_id = batch[-1].id
+        self.stdout.write(f"Packed equipment of {packed} heroes, {skipped} changed meanwhile and were skipped")
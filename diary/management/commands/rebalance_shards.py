@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from diary import shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Change the worker shards (see diary.shards) and move the queued hero jobs whose shard changed. "
+        "Start the workers of added shards before, stop the workers of removed shards after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("shards", nargs="*", help="every shard after the change")
+        parser.add_argument("--add", nargs="+", default=[], metavar="SHARD")
+        parser.add_argument("--remove", nargs="+", default=[], metavar="SHARD")
+        parser.add_argument("--clear", action="store_true", help="stop sharding, back to the plain queues")
+        parser.add_argument("--settle", type=float, default=shards.RING_TTL, help="seconds to let processes reread")
+
+    def handle(self, *args, **options):
+        from worker import conn
+
+        ring = shards.load_ring(conn)
+        current = set(ring.shards) if ring else set()
+        if options["clear"]:
+            target = set()
+        elif options["shards"]:
+            target = set(options["shards"])
+        else:
+            target = (current | set(options["add"])) - set(options["remove"])
+        if not target and not options["clear"]:
+            raise CommandError("No shards left; use --clear to stop sharding")
+        moved = shards.rebalance(conn, sorted(target), options["settle"])
+        self.stdout.write(f"Shards: {', '.join(sorted(current)) or '-'} -> {', '.join(sorted(target)) or '-'}")
+        self.stdout.write(f"Moved {moved} queued jobs")
@@ -0,0 +1,156 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rq import Queue, Worker
+from rq.job import Job, JobStatus
+
+from diary import models, shards
+from diary.management.commands.bench_servers import free_port
+
+try:
+    from fakeredis import TcpFakeServer
+except ImportError:
+    TcpFakeServer = None
+
+DONE = (JobStatus.FINISHED, JobStatus.FAILED)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run one `worker.py --shard` process per shard against an in-process fakeredis server, queue "
+        "catch-ups and range ticks for the first heroes, optionally add a shard half way, and check that "
+        "every job ran on the worker of its shard. Uses the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shards", type=int, default=3)
+        parser.add_argument("--add-shard", action="store_true", help="start one more worker and rebalance half way")
+        parser.add_argument("--heroes", type=int, default=200)
+        parser.add_argument("--partition-size", type=int, default=20)
+        parser.add_argument("--timeout", type=float, default=300)
+
+    def handle(self, *args, **options):
+        if TcpFakeServer is None:
+            raise CommandError("fakeredis is not installed")
+        hero_ids = list(models.Hero.objects.order_by("id").values_list("id", flat=True)[: options["heroes"]])
+        if not hero_ids:
+            raise CommandError("No heroes, create some with manage.py create_heroes")
+        size = options["partition_size"]
+        server = TcpFakeServer(("127.0.0.1", free_port()))
+        server.daemon_threads = True  # workers blocked in BLPOP must not keep the server open
+        threading.Thread(target=server.serve_forever, name="fakeredis", daemon=True).start()
+        url = "redis://{}:{}".format(*server.server_address)
+        connection = redis.from_url(url)
+        names = [f"s{index}" for index in range(options["shards"])]
+        workers = {}
+        self.queues = {}
+        start = time.perf_counter()
+        try:
+            shards.rebalance(connection, names, settle=0, partition_size=size)
+            for name in names:
+                workers[name] = self.start_worker(connection, name, url, options["verbosity"])
+            half = len(hero_ids) // 2
+            jobs = self.enqueue(connection, hero_ids[:half], size)
+            if options["add_shard"]:
+                name = f"s{len(names)}"
+                workers[name] = self.start_worker(connection, name, url, options["verbosity"])
+                moved = shards.rebalance(connection, list(workers), settle=0, partition_size=size)
+                self.stdout.write(f"Added shard {name}, moved {moved} queued jobs")
+            jobs += self.enqueue(connection, hero_ids[half:], size)
+            self.wait(connection, jobs, options["timeout"])
+            self.verify(connection, jobs, size)
+        finally:
+            for process in workers.values():
+                process.terminate()
+                process.wait()
+            server.shutdown()
+            server.server_close()
+        self.stdout.write(f"{len(jobs)} jobs on {len(workers)} workers in {time.perf_counter() - start:.1f} s")
+
+    def start_worker(self, connection, shard: str, url: str, verbosity: int) -> subprocess.Popen:
+        """Start a worker and wait until it registered, one at a time, see queue()."""
+        output = None if verbosity > 1 else subprocess.DEVNULL
+        process = subprocess.Popen(
+            [sys.executable, "worker.py", "--shard", shard],
+            cwd=settings.BASE_DIR,
+            env=dict(
+                os.environ,
+                REDISTOGO_URL=url,
+                PYTHONPATH=os.pathsep.join([str(settings.BASE_DIR), os.environ.get("PYTHONPATH", "")]),
+            ),
+            stdout=output,
+            stderr=output,
+        )
+        deadline = time.monotonic() + 30
+        while not connection.exists(f"{Worker.redis_worker_namespace_prefix}shard-{shard}.{process.pid}"):
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise CommandError(f"Worker of shard {shard} did not start")
+            time.sleep(0.1)
+        return process
+
+    def queue(self, connection, name: str) -> Queue:
+        """One Queue per name. fakeredis has no INFO and drops the connection after the version probe
+        every new Queue makes, so probe once here and give the pool a moment to notice."""
+        if name not in self.queues:
+            self.queues[name] = Queue(name, connection=connection)
+            self.queues[name].get_redis_server_version()
+            time.sleep(0.05)
+        return self.queues[name]
+
+    def enqueue(self, connection, hero_ids, size) -> list:
+        """A catch-up per hero on its high queue and a tick per range on its low queue."""
+        ring = shards.load_ring(connection)
+        jobs = []
+        for hero_id in hero_ids:
+            queue = self.queue(connection, ring.queue_for(hero_id, "high", size))
+            jobs.append(queue.enqueue("diary.tasks.advance_hero", hero_id, result_ttl=3600).id)
+        for partition in sorted({hero_id // size for hero_id in hero_ids}):
+            queue = self.queue(connection, ring.partition_queue(partition, "low"))
+            job = queue.enqueue("diary.tasks.advance_heroes", partition * size, (partition + 1) * size, result_ttl=3600)
+            jobs.append(job.id)
+        return jobs
+
+    def wait(self, connection, job_ids, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            jobs = Job.fetch_many(job_ids, connection=connection)
+            if all(job is not None and job.get_status(refresh=False) in DONE for job in jobs):
+                return
+            time.sleep(0.2)
+        raise CommandError(f"Jobs still pending after {timeout} s")
+
+    def verify(self, connection, job_ids, size):
+        per_shard = Counter()
+        failed, misplaced = [], []
+        runs = defaultdict(list)
+        for job in Job.fetch_many(job_ids, connection=connection):
+            shard = job.origin.partition("-")[2]
+            worker_shard = job.worker_name.rpartition(".")[0].removeprefix("shard-")
+            per_shard[worker_shard] += 1
+            if job.get_status(refresh=False) == JobStatus.FAILED:
+                failed.append(job.id)
+            if worker_shard != shard:
+                misplaced.append(job.id)
+            runs[shards.job_partition(job, size)].append((job.started_at, job.ended_at, worker_shard))
+        # Two workers inside one range at the same time; only expected around a rebalance.
+        overlaps = 0
+        for intervals in runs.values():
+            intervals.sort()
+            for (_, ended, shard), (started, _, next_shard) in zip(intervals, intervals[1:]):
+                overlaps += shard != next_shard and started < ended
+        self.stdout.write(
+            "Jobs per shard: " + ", ".join(f"{shard} {count}" for shard, count in sorted(per_shard.items()))
+        )
+        self.stdout.write(f"Ranges on two workers at once: {overlaps}")
+        if failed:
+            self.stderr.write(Job.fetch(failed[0], connection=connection).exc_info)
+        if failed or misplaced:
+            raise CommandError(f"{len(failed)} jobs failed, {len(misplaced)} ran outside their shard")
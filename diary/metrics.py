@@ -0,0 +1,350 @@
+"""Metrics in the Prometheus text format, served by ``metrics_view`` at /metrics.
+
+Counters are always updated; histograms only for a ``DIARY_METRICS_SAMPLE_RATE`` share of runs
+and requests, which keeps the cost of timing and query counting negligible under load. Every
+process records locally and adds what it recorded to totals in Redis (``DIARY_METRICS_STORE``)
+at most every ``PUSH_INTERVAL`` seconds and after every job, so a scrape of any web worker sees
+the diary runs of the rq workers and of all web workers.
+"""
+
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.db.models import Count, Min, Q
+from django.http import HttpResponse
+
+from diary import consts, models
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+BACKLOG_BUCKETS = (60, 300, 3600, 6 * 3600, 86400, 7 * 86400, 30 * 86400)
+BACKLOG_CACHE_KEY = "diary:metrics:backlog"
+BACKLOG_CACHE_SECONDS = 60
+PUSH_INTERVAL = 5
+
+_sampler = random.Random()
+
+
+def sampled() -> bool:
+    return _sampler.random() < settings.DIARY_METRICS_SAMPLE_RATE
+
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+
+def format_value(value: float):
+    return int(value) if float(value).is_integer() else value
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def drain(self) -> dict:
+        """Values recorded since the last drain, by store field, and start over."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return {json.dumps(labels): value for labels, value in values.items()}
+
+    def merge(self, fields: dict):
+        for field, value in fields.items():
+            self.inc(*json.loads(field), value=float(value))
+
+    def render(self, fields: dict = None):
+        """Render the store's totals ``fields``, or the values of this process."""
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        if fields is None:
+            with self._lock:
+                values = sorted(self._values.items())
+        else:
+            values = sorted((tuple(json.loads(field)), float(value)) for field, value in fields.items())
+        for labels, value in values:
+            yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=TIME_BUCKETS, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._values = {}  # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            values = self._values.setdefault(labels, [0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+            values[-2] += 1
+            values[-1] += value
+
+    def drain(self) -> dict:
+        """Values recorded since the last drain, one store field per series and position, and start over."""
+        with self._lock:
+            series, self._values = self._values, {}
+        return {
+            json.dumps(labels + (index,)): value
+            for labels, values in series.items()
+            for index, value in enumerate(values)
+            if value
+        }
+
+    def unpack(self, fields: dict) -> dict:
+        series = {}
+        for field, value in fields.items():
+            *labels, index = json.loads(field)
+            series.setdefault(tuple(labels), [0] * (len(self.buckets) + 2))[index] += float(value)
+        return series
+
+    def merge(self, fields: dict):
+        with self._lock:
+            for labels, values in self.unpack(fields).items():
+                current = self._values.setdefault(labels, [0] * (len(self.buckets) + 2))
+                for index, value in enumerate(values):
+                    current[index] += value
+
+    def render(self, fields: dict = None):
+        """Render the store's totals ``fields``, or the values of this process."""
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        if fields is None:
+            with self._lock:
+                series = sorted((labels, list(values)) for labels, values in self._values.items())
+        else:
+            series = sorted(self.unpack(fields).items())
+        for labels, values in series:
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                bucket_labels = format_labels(self.labels + ("le",), labels + (bound,))
+                yield f"{self.name}_bucket{bucket_labels} {format_value(count)}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {format_value(values[-2])}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {values[-1]}"
+
+
+ACTIONS = Counter("diary_actions_total", "Actions taken by heroes.", ["action"])
+RUNS = Counter("diary_runs_total", "Diary runs.")
+RUN_ACTIONS = Histogram("diary_run_actions", "Actions per diary run.", (0, 1, 5, 10, 25, 50, 100))
+RUN_QUERIES = Histogram("diary_run_queries", "Queries per catch-up, loading and saving included.", (2, 5, 10, 20, 50))
+RUN_SECONDS = Histogram("diary_process_story_seconds", "Time spent in Diary.process_story.")
+RENDER_SECONDS = Histogram("diary_render_seconds", "Time spent rendering templates.", labels=["template"])
+REQUEST_SECONDS = Histogram("diary_request_seconds", "Request time by view.", labels=["view"])
+REQUEST_QUERIES = Histogram("diary_request_queries", "Queries per request by view.", (1, 2, 5, 10, 20, 50), ["view"])
+REGISTRY = [ACTIONS, RUNS, RUN_ACTIONS, RUN_QUERIES, RUN_SECONDS, RENDER_SECONDS, REQUEST_SECONDS, REQUEST_QUERIES]
+ACTION_NAMES = {action_type.value: action_type.name.lower() for action_type in consts.ActionType}
+
+
+class RedisStore:
+    """Totals of all processes, one hash per metric with a field per series."""
+
+    KEY_PREFIX = "diary:metrics:"
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def add(self, drained: dict):
+        pipeline = self.connection.pipeline(transaction=False)
+        for metric, fields in drained.items():
+            for field, value in fields.items():
+                pipeline.hincrbyfloat(self.KEY_PREFIX + metric.name, field, value)
+        pipeline.execute()
+
+    def load(self, metrics) -> list:
+        pipeline = self.connection.pipeline(transaction=False)
+        for metric in metrics:
+            pipeline.hgetall(self.KEY_PREFIX + metric.name)
+        return [{field.decode(): value for field, value in fields.items()} for fields in pipeline.execute()]
+
+
+_store = None
+_last_push = 0.0
+_push_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if settings.DIARY_METRICS_STORE != "redis":
+        return None
+    if _store is None:
+        from diary.dispatch import dispatch_connection
+
+        _store = RedisStore(dispatch_connection())
+    return _store
+
+
+def push_due() -> bool:
+    return time.monotonic() - _last_push >= PUSH_INTERVAL
+
+
+def push(force: bool = False):
+    """Add what this process recorded to the store's totals, at most every PUSH_INTERVAL unless forced.
+    Values stay local until the next push while the store is unavailable."""
+    global _last_push
+    store = get_store()
+    if store is None or not (force or push_due()) or not _push_lock.acquire(blocking=force):
+        return
+    import redis  # only loaded with a Redis store, like the job dispatcher
+
+    try:
+        _last_push = time.monotonic()
+        drained = {metric: metric.drain() for metric in REGISTRY}
+        try:
+            store.add(drained)
+        except redis.RedisError:
+            logger.warning("Metrics store unavailable, keeping values for the next push", exc_info=True)
+            for metric, fields in drained.items():
+                metric.merge(fields)
+    finally:
+        _push_lock.release()
+
+
+def record_run(action_counts, seconds: float):
+    RUNS.inc()
+    for index, count in enumerate(action_counts):
+        if count:
+            ACTIONS.inc(ACTION_NAMES[index], value=count)
+    if sampled():
+        RUN_ACTIONS.observe(sum(action_counts))
+        RUN_SECONDS.observe(seconds)
+    push()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries(enabled: bool = True):
+    """Count queries on this thread's connection; yields None when not enabled."""
+    if not enabled:
+        yield None
+        return
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels, enabled: bool = True):
+    start = time.perf_counter()
+    yield
+    if enabled:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+class MetricsMiddleware:
+    """Times sampled requests by view name; queries are counted for sync requests only."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not sampled():
+            return self.get_response(request)
+        start = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+        view = self.view_name(request)
+        REQUEST_SECONDS.observe(time.perf_counter() - start, view)
+        REQUEST_QUERIES.observe(queries.count, view)
+        push()
+        return response
+
+    async def __acall__(self, request):
+        if not sampled():
+            return await self.get_response(request)
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        REQUEST_SECONDS.observe(time.perf_counter() - start, self.view_name(request))
+        if push_due():
+            await sync_to_async(push)()
+        return response
+
+    @staticmethod
+    def view_name(request) -> str:
+        match = request.resolver_match
+        return match.url_name or match.view_name if match else "unresolved"
+
+
+def render_backlog():
+    """Heroes by how far they lag behind now (now - last_action), from one aggregate query over all
+    heroes; metrics_view caches it for BACKLOG_CACHE_SECONDS."""
+    now = datetime.now(timezone.utc)
+    buckets = {
+        f"le_{bound}": Count("id", filter=Q(last_action__gte=now - timedelta(seconds=bound)))
+        for bound in BACKLOG_BUCKETS
+    }
+    stats = models.Hero.objects.aggregate(total=Count("id"), oldest=Min("last_action"), **buckets)
+    yield "# HELP diary_backlog_heroes Heroes whose catch-up backlog is at most le seconds."
+    yield "# TYPE diary_backlog_heroes gauge"
+    for bound in BACKLOG_BUCKETS:
+        yield f'diary_backlog_heroes{{le="{bound}"}} {stats[f"le_{bound}"]}'
+    yield f'diary_backlog_heroes{{le="+Inf"}} {stats["total"]}'
+    yield "# HELP diary_backlog_max_seconds Backlog of the hero furthest behind."
+    yield "# TYPE diary_backlog_max_seconds gauge"
+    oldest = stats["oldest"]
+    yield f"diary_backlog_max_seconds {(now - oldest).total_seconds() if oldest else 0}"
+
+
+def allowed(request) -> bool:
+    """Scrapers send ``Authorization: Bearer <DIARY_METRICS_TOKEN>``; staff may look without it."""
+    token = settings.DIARY_METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return True
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    if not allowed(request):
+        raise PermissionDenied
+    store = get_store()
+    if store is None:
+        lines = [line for metric in REGISTRY for line in metric.render()]
+    else:
+        import redis
+
+        push(force=True)
+        try:
+            totals = store.load(REGISTRY)
+        except redis.RedisError:
+            logger.warning("Metrics store unavailable", exc_info=True)
+            return HttpResponse("Metrics store unavailable\n", status=503, content_type="text/plain")
+        lines = [line for metric, fields in zip(REGISTRY, totals) for line in metric.render(fields)]
+    lines += cache.get_or_set(BACKLOG_CACHE_KEY, lambda: list(render_backlog()), BACKLOG_CACHE_SECONDS)
+    return HttpResponse("\n".join(lines) + "\n", content_type="text/plain; version=0.0.4")
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0005_equipment_suffix"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DiaryEntry",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "event",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (1, "travel to killing fields"),
+                            (2, "in killing fields"),
+                            (3, "kill monster"),
+                            (4, "get attribute"),
+                            (5, "get item"),
+                            (6, "travel to town"),
+                            (7, "in town"),
+                            (8, "sell item"),
+                            (9, "buy equipment"),
+                            (10, "trips to killing fields"),
+                            (11, "equipment bought on trips"),
+                        ]
+                    ),
+                ),
+                ("offset", models.IntegerField()),
+                ("arg1", models.IntegerField(default=0)),
+                ("arg2", models.IntegerField(default=0)),
+                ("arg3", models.IntegerField(default=0)),
+                (
+                    "hero",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="diary_entries", to="diary.hero"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["hero", "offset", "id"], name="diary_entry_hero_offset")],
+            },
+        ),
+    ]
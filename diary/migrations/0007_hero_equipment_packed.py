@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0006_diaryentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hero",
+            name="equipment_packed",
+            field=models.BinaryField(null=True),
+        ),
+    ]
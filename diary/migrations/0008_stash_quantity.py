@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:19
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def group_stash(apps, schema_editor):
+    Hero = apps.get_model("diary", "Hero")
+    Item = apps.get_model("diary", "Item")
+    groups = Item.objects.values("owner", "name", "quality").annotate(first=Min("id"), quantity=Count("id"))
+    for group in groups.filter(quantity__gt=1).iterator():
+        Item.objects.filter(pk=group["first"]).update(quantity=group["quantity"])
+        Item.objects.filter(owner=group["owner"], name=group["name"], quality=group["quality"]).exclude(
+            pk=group["first"]
+        ).delete()
+    for owner, stash_count in Item.objects.values_list("owner").annotate(stash_count=Sum("quantity")).iterator():
+        Hero.objects.filter(pk=owner).update(stash_count=stash_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0007_hero_equipment_packed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hero",
+            name="stash_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="item",
+            name="quantity",
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name="diaryentry",
+            name="event",
+            field=models.PositiveSmallIntegerField(
+                choices=[
+                    (1, "travel to killing fields"),
+                    (2, "in killing fields"),
+                    (3, "kill monster"),
+                    (4, "get attribute"),
+                    (5, "get item"),
+                    (6, "travel to town"),
+                    (7, "in town"),
+                    (8, "sell item"),
+                    (9, "buy equipment"),
+                    (10, "trips to killing fields"),
+                    (11, "equipment bought on trips"),
+                    (12, "sell stash"),
+                ]
+            ),
+        ),
+        migrations.RunPython(group_stash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0008_stash_quantity"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="item",
+            constraint=models.UniqueConstraint(fields=("owner", "name", "quality"), name="unique_stash_item"),
+        ),
+    ]
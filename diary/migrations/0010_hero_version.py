@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0009_unique_stash_item"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hero",
+            name="version",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:24
+
+import diary.rng
+from django.db import migrations, models
+
+
+def seed_heroes(apps, schema_editor):
+    # AddField evaluates the default once, which would give every existing hero the same stream.
+    Hero = apps.get_model("diary", "Hero")
+    heroes = list(Hero.objects.only("id"))
+    for hero in heroes:
+        hero.rng_seed = diary.rng.new_seed()
+    Hero.objects.bulk_update(heroes, ["rng_seed"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0010_hero_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hero",
+            name="rng_position",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="hero",
+            name="rng_seed",
+            field=models.BigIntegerField(default=diary.rng.new_seed),
+        ),
+        migrations.RunPython(seed_heroes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:38
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def drop_duplicate_slots(apps, schema_editor):
+    # Without the constraint a hero could end up with two rows for a slot; keep the better one.
+    Equipment = apps.get_model("diary", "Equipment")
+    duplicates = Equipment.objects.values("owner", "slot").annotate(rows=Count("id")).filter(rows__gt=1)
+    for group in duplicates.iterator():
+        rows = Equipment.objects.filter(owner=group["owner"], slot=group["slot"]).order_by(
+            (F("prefix") * F("suffix")).desc(), "-id"
+        )
+        Equipment.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0011_hero_rng"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="hero",
+            index=models.Index(fields=["last_action"], name="hero_last_action"),
+        ),
+        migrations.AddIndex(
+            model_name="hero",
+            index=models.Index(
+                condition=models.Q(("equipment_packed__isnull", True)), fields=["id"], name="hero_unpacked"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(fields=["owner", "id"], name="item_owner_id"),
+        ),
+        migrations.RunPython(drop_duplicate_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="equipment",
+            constraint=models.UniqueConstraint(fields=("owner", "slot"), name="unique_equipment_slot"),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+import bisect
+import struct
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+# Copies of diary.models and diary.equipment as of this migration, which must not change with them.
+LEVEL_THRESHOLDS = tuple(8**level for level in range(21))
+SLOT_FORMAT = struct.Struct("<BBh")
+SLOTS = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+
+def level_for_experience(experience):
+    return bisect.bisect_left(LEVEL_THRESHOLDS, experience)
+
+
+def packed_score(data):
+    # diary.equipment.unpack builds current models, which do not accept a historical Hero.
+    return sum(
+        4 ** (prefix - 1) * 4 ** (suffix - 1) * slot
+        for slot, (prefix, suffix, _) in zip(SLOTS, SLOT_FORMAT.iter_unpack(bytes(data)))
+        if prefix
+    )
+
+
+def rank_heroes(apps, schema_editor):
+    Hero = apps.get_model("diary", "Hero")
+    Equipment = apps.get_model("diary", "Equipment")
+    heroes = Hero.objects.order_by("id").only("id", "experience", "equipment_packed")
+    batch = list(heroes[:1000])
+    while batch:
+        rank_batch(Hero, Equipment, batch)
+        batch = list(heroes.filter(id__gt=batch[-1].id)[:1000])
+
+
+def rank_batch(Hero, Equipment, heroes):
+    scores = dict(
+        Equipment.objects.filter(owner__in=[hero.id for hero in heroes if hero.equipment_packed is None])
+        .values_list("owner")
+        .annotate(score=Sum(F("prefix") * F("suffix") * F("slot")))
+    )
+    for hero in heroes:
+        hero.rank_level = level_for_experience(hero.experience)
+        if hero.equipment_packed is not None:
+            hero.equipment_score = packed_score(hero.equipment_packed)
+        else:
+            hero.equipment_score = scores.get(hero.id, 0)
+    Hero.objects.bulk_update(heroes, ["rank_level", "equipment_score"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0012_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hero",
+            name="equipment_score",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="hero",
+            name="rank_level",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(rank_heroes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="hero",
+            index=models.Index(fields=["-rank_level", "-experience", "id"], name="hero_level_rank"),
+        ),
+        migrations.AddIndex(
+            model_name="hero",
+            index=models.Index(fields=["-equipment_score", "id"], name="hero_equipment_rank"),
+        ),
+    ]
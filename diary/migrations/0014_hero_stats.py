@@ -0,0 +1,62 @@
+from django.db import migrations, models
+from django.db.models import Case, F, When
+from django.db.models.functions import Log
+
+# Copies of diary.models and diary.consts as of this migration, which must not change with them.
+LEVEL_THRESHOLDS = tuple(8**level for level in range(21))
+BASE_CAPACITY = 10
+BASE_SPEED_OF_TRAVEL = 1
+SPEED_OF_TRAVEL_MULTIPLIER = 0.1
+LUCK_MULTIPLIER = 0.1
+
+
+def compute_stats(apps, schema_editor):
+    Hero = apps.get_model("diary", "Hero")
+    Hero.objects.update(
+        # Exact thresholds instead of the rounded logarithm rank_level was computed with.
+        level=Case(
+            *(When(experience__lte=threshold, then=level) for level, threshold in enumerate(LEVEL_THRESHOLDS)),
+            default=len(LEVEL_THRESHOLDS),
+        ),
+        capacity=F("strength") + BASE_CAPACITY,
+        speed_of_travel=BASE_SPEED_OF_TRAVEL + F("agility") * SPEED_OF_TRAVEL_MULTIPLIER,
+        luck=F("wisdom") * LUCK_MULTIPLIER,
+        merchant_discount=Log(2, F("charisma")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diary", "0013_leaderboard"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(model_name="hero", name="hero_level_rank"),
+        migrations.RenameField(model_name="hero", old_name="rank_level", new_name="level"),
+        migrations.AddField(
+            model_name="hero",
+            name="capacity",
+            field=models.IntegerField(default=10),
+        ),
+        migrations.AddField(
+            model_name="hero",
+            name="speed_of_travel",
+            field=models.FloatField(default=1),
+        ),
+        migrations.AddField(
+            model_name="hero",
+            name="luck",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="hero",
+            name="merchant_discount",
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(compute_stats, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="hero",
+            index=models.Index(fields=["-level", "-experience", "id"], name="hero_level_rank"),
+        ),
+    ]
@@ -1,9 +1,30 @@
+import bisect
 import math
-from random import choice
+from datetime import timedelta
+from functools import cached_property
 
 from django.db import models
 
 from diary import consts
+from diary.rng import HeroRandom, new_seed
+
+# Level n covers experience up to 8 ** n, so the level is the first threshold not below it.
+LEVEL_THRESHOLDS = tuple(8**level for level in range(21))  # 8 ** 20 still fits in int64
+
+# Attribute -> (stored stat, how it derives from the attribute).
+ATTRIBUTE_STATS = {
+    "strength": ("capacity", lambda strength: strength + consts.BASE_CAPACITY),
+    "agility": (
+        "speed_of_travel",
+        lambda agility: consts.BASE_SPEED_OF_TRAVEL + agility * consts.SPEED_OF_TRAVEL_MULTIPLIER,
+    ),
+    "wisdom": ("luck", lambda wisdom: wisdom * consts.LUCK_MULTIPLIER),
+    "charisma": ("merchant_discount", math.log2),
+}
+
+
+def level_for_experience(experience):
+    return bisect.bisect_left(LEVEL_THRESHOLDS, experience)
 
 
 class Hero(models.Model):
@@ -23,41 +44,59 @@ class Hero(models.Model):
         (consts.LOCATION_ROAD_TOWN, "In road to Town"),
     )
     location = models.IntegerField(choices=LOCATION, default=1)
-
-    @property
-    def capacity(self):
-        return self.strength + consts.BASE_CAPACITY
-
-    @property
-    def speed_of_travel(self):
-        return consts.BASE_SPEED_OF_TRAVEL + self.agility * consts.SPEED_OF_TRAVEL_MULTIPLIER
-
-    @property
-    def luck(self):
-        return self.wisdom * consts.LUCK_MULTIPLIER
-
-    @property
-    def merchant_discount(self):
-        return math.log2(self.charisma)
-
-    @property
-    def level(self):
-        current_exp = max(self.experience, 1)
-        logaritmic_level = math.log(current_exp, 8)
-        return math.ceil(logaritmic_level)
+    stash_count = models.IntegerField(default=0)  # total quantity of the hero's items
+    version = models.IntegerField(default=0)  # bumped by every diary flush, see diary.state
+    # Stats derived from experience and attributes, kept current by gain_experience and add_attribute.
+    level = models.IntegerField(default=0)
+    capacity = models.IntegerField(default=consts.BASE_CAPACITY)
+    speed_of_travel = models.FloatField(default=consts.BASE_SPEED_OF_TRAVEL)
+    luck = models.FloatField(default=0)
+    merchant_discount = models.FloatField(default=0)
+    equipment_score = models.IntegerField(default=0)  # refreshed by every diary flush, see diary.leaderboard
+    # Random stream of the hero, see diary.rng; the position advances with every draw.
+    rng_seed = models.BigIntegerField(default=new_seed)
+    rng_position = models.BigIntegerField(default=0)
+    # Packed equipment slots, see diary.equipment; None while the hero uses Equipment rows.
+    equipment_packed = models.BinaryField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["last_action"], name="hero_last_action"),
+            # Heroes still on Equipment rows, for pack_equipment.
+            models.Index(fields=["id"], condition=models.Q(equipment_packed__isnull=True), name="hero_unpacked"),
+            models.Index(fields=["-level", "-experience", "id"], name="hero_level_rank"),
+            models.Index(fields=["-equipment_score", "id"], name="hero_equipment_rank"),
+        ]
+
+    @cached_property
+    def rng(self):
+        return HeroRandom(self)
+
+    def save(self, *args, **kwargs):
+        self.refresh_stats()
+        super().save(*args, **kwargs)
+
+    def refresh_stats(self):
+        """Recompute every stored stat, for heroes built or edited outside the diary."""
+        self.level = level_for_experience(self.experience)
+        for attribute, (stat, derive) in ATTRIBUTE_STATS.items():
+            setattr(self, stat, derive(getattr(self, attribute)))
+
+    def gain_experience(self, experience: int):
+        self.experience += experience
+        while self.experience > LEVEL_THRESHOLDS[self.level]:
+            self.level += 1
+
+    def add_attribute(self, attribute: str, amount: int = 1):
+        value = getattr(self, attribute) + amount
+        setattr(self, attribute, value)
+        if attribute in ATTRIBUTE_STATS:
+            stat, derive = ATTRIBUTE_STATS[attribute]
+            setattr(self, stat, derive(value))
 
     def add_random_attribute(self):
-        option = choice(["strength", "agility", "vitality", "wisdom", "charisma"])
-        if option == "strength":
-            self.strength += +1
-        if option == "agility":
-            self.agility += +1
-        if option == "vitality":
-            self.vitality += +1
-        if option == "wisdom":
-            self.wisdom += +1
-        if option == "charisma":
-            self.charisma += +1
+        option = self.rng.choice(consts.ATTRIBUTES)
+        self.add_attribute(option)
         return option
 
 
@@ -71,8 +110,13 @@ class Item(models.Model):
 
     name = models.CharField(max_length=255)
     quality = models.IntegerField(choices=QUALITY)
+    quantity = models.IntegerField(default=1)
     owner = models.ForeignKey(Hero, on_delete=models.CASCADE, related_name="items")
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["owner", "name", "quality"], name="unique_stash_item")]
+        indexes = [models.Index(fields=["owner", "id"], name="item_owner_id")]
+
     @property
     def price(self):
         return self.owner.level * self.quality
@@ -115,13 +159,79 @@ class Equipment(models.Model):
     )
     slot = models.IntegerField(choices=SLOTS)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["owner", "slot"], name="unique_equipment_slot")]
+
     @property
     def price(self):
         return self.prefix * self.suffix * self.slot
 
     @property
     def price_next(self):
-        return self.prefix * self.suffix * self.slot * 4
+        return self.upgrade_price(self.prefix, self.suffix, self.slot)
+
+    @staticmethod
+    def upgrade_price(prefix, suffix, slot):
+        return prefix * suffix * slot * 4
 
     def __str__(self):
         return f"{self.get_prefix_display()} {self.get_slot_display()} {self.get_suffix_display()} {self.modifier}"
+
+
+class DiaryEntry(models.Model):
+    EVENTS = (
+        (consts.EVENT_TRAVEL_TO_KILLING_FIELD, "travel to killing fields"),
+        (consts.EVENT_KILLING_FIELD, "in killing fields"),
+        (consts.EVENT_KILL_MONSTER, "kill monster"),
+        (consts.EVENT_ATTRIBUTE, "get attribute"),
+        (consts.EVENT_LOOT, "get item"),
+        (consts.EVENT_TRAVEL_TO_TOWN, "travel to town"),
+        (consts.EVENT_TOWN, "in town"),
+        (consts.EVENT_SELL_ITEM, "sell item"),
+        (consts.EVENT_BUY_EQUIPMENT, "buy equipment"),
+        (consts.EVENT_TRIPS, "trips to killing fields"),
+        (consts.EVENT_TRIPS_EQUIPMENT, "equipment bought on trips"),
+        (consts.EVENT_SELL_STASH, "sell stash"),
+    )
+
+    hero = models.ForeignKey(Hero, on_delete=models.CASCADE, related_name="diary_entries")
+    event = models.PositiveSmallIntegerField(choices=EVENTS)
+    offset = models.IntegerField()  # seconds since consts.DIARY_EPOCH
+    arg1 = models.IntegerField(default=0)
+    arg2 = models.IntegerField(default=0)
+    arg3 = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["hero", "offset", "id"], name="diary_entry_hero_offset")]
+
+    @staticmethod
+    def offset_for(timestamp):
+        return int((timestamp - consts.DIARY_EPOCH).total_seconds())
+
+    @property
+    def timestamp(self):
+        return consts.DIARY_EPOCH + timedelta(seconds=self.offset)
+
+    @property
+    def text(self):
+        if self.event == consts.EVENT_KILL_MONSTER:
+            return f"kill {consts.LIST_OF_MONSTER[self.arg1]}"
+        if self.event == consts.EVENT_ATTRIBUTE:
+            return f"get attribute {consts.ATTRIBUTES[self.arg1]} +{self.arg2}"
+        if self.event == consts.EVENT_LOOT:
+            return f"get <{dict(Item.QUALITY)[self.arg2]}> {consts.LIST_OF_ITEMS[self.arg1]}"
+        if self.event == consts.EVENT_SELL_ITEM:
+            return f"sell item <{dict(Item.QUALITY)[self.arg2]}> {consts.LIST_OF_ITEMS[self.arg1]} - price: {self.arg3}"
+        if self.event == consts.EVENT_SELL_STASH:
+            return f"sell {self.arg1} items - price: {self.arg2}"
+        if self.event == consts.EVENT_BUY_EQUIPMENT:
+            equipment = Equipment(slot=self.arg1, prefix=self.arg2, suffix=self.arg3, modifier=0)
+            return f"buy equipment {equipment}"
+        if self.event == consts.EVENT_TRIPS:
+            return f"{self.arg1} trips to killing fields - kill {self.arg2} monsters - earn {self.arg3} gold"
+        if self.event == consts.EVENT_TRIPS_EQUIPMENT:
+            return f"buy {self.arg1} equipment on the way"
+        return self.get_event_display()
+
+    def __str__(self):
+        return f"{self.timestamp} - {self.text}"
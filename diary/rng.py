@@ -0,0 +1,70 @@
+"""Per-hero random streams.
+
+Position ``n`` of a hero's stream is draw ``n % BLOCK`` of a Mersenne Twister seeded with the
+hero's ``rng_seed`` and block ``n // BLOCK``. A value only depends on the seed and the position,
+so a diary run can be replayed, verified or recomputed elsewhere with identical results, and
+skipping ahead costs at most one block. The position is kept on the hero and saved with it.
+"""
+
+import random
+from bisect import bisect
+from itertools import accumulate
+
+BLOCK = 4096
+
+
+def new_seed() -> int:
+    return random.getrandbits(63)  # fits a signed BigIntegerField
+
+
+def cumulative(weights) -> tuple:
+    return tuple(accumulate(weights))
+
+
+class HeroRandom:
+    def __init__(self, hero):
+        self.hero = hero
+        self._generator = random.Random()
+        self._position = None  # position the generator is at
+
+    def _seek(self) -> int:
+        position = self.hero.rng_position
+        if position != self._position:
+            block, offset = divmod(position, BLOCK)
+            if self._position is None or not 0 <= position - self._position < BLOCK - self._position % BLOCK:
+                self._generator.seed((self.hero.rng_seed << 32) + block)
+                skip = offset
+            else:
+                skip = position - self._position
+            if skip:
+                self._generator.getrandbits(32 * skip)
+            self._position = position
+        return position
+
+    def below_many(self, n: int, k: int) -> list:
+        """``k`` values in ``range(n)``, for ``n`` up to 2 ** 32."""
+        values = []
+        while k:
+            position = self._seek()
+            count = min(k, BLOCK - position % BLOCK)
+            getrandbits = self._generator.getrandbits
+            values += [(getrandbits(32) * n) >> 32 for _ in range(count)]
+            self.hero.rng_position = position + count
+            self._position = None if self.hero.rng_position % BLOCK == 0 else self.hero.rng_position
+            k -= count
+        return values
+
+    def below(self, n: int) -> int:
+        return self.below_many(n, 1)[0]
+
+    def randint(self, a: int, b: int) -> int:
+        return a + self.below(b - a + 1)
+
+    def choice(self, sequence):
+        return sequence[self.below(len(sequence))]
+
+    def choices(self, population, cum_weights, k: int = 1) -> list:
+        return [population[bisect(cum_weights, value)] for value in self.below_many(cum_weights[-1], k)]
+
+    def skip(self, count: int):
+        self.hero.rng_position += count
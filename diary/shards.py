@@ -0,0 +1,136 @@
+"""Hero affinity for the rq workers: each hero belongs to one shard and one worker serves a shard.
+
+Heroes are grouped in the id ranges of ``tasks.PARTITION_SIZE`` that the scheduler ticks, and a
+consistent hash ring maps every range onto a shard, so the background tick of a range and the
+interactive catch-ups of its heroes meet on the same worker (``python worker.py --shard NAME``).
+That worker listens on ``high-NAME`` before ``low-NAME``. The shard names live in Redis under
+``SHARDS_KEY``; while there are none, jobs go to the plain ``high`` and ``low`` queues.
+
+``rebalance`` changes the shards. Adding or removing one moves only the ranges that hash onto it,
+and their queued jobs are moved to their new queue. A job the old worker already started can still
+overlap with the first job on the new worker for a moment; the version check on Hero makes the
+later flush retry instead of overwriting.
+"""
+
+import bisect
+import hashlib
+import time
+
+from rq import Queue
+
+from diary.tasks import PARTITION_SIZE
+
+SHARDS_KEY = "diary:shards"
+REPLICAS = 64  # points per shard on the ring, to spread ranges evenly
+RING_TTL = 10  # seconds a process keeps the shards it read from Redis
+PRIORITIES = ("high", "low")
+# Jobs that advance heroes, with the index of the hero id in their arguments.
+HERO_JOBS = {"diary.tasks.advance_hero": 0, "diary.tasks.advance_heroes": 0}
+
+
+def stable_hash(key: str) -> int:
+    # hash() is salted per process, the ring has to agree across processes and machines.
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def queue_name(shard: str, priority: str) -> str:
+    return f"{priority}-{shard}"
+
+
+class HashRing:
+    def __init__(self, shards, replicas: int = REPLICAS):
+        self.shards = tuple(sorted(shards))
+        points = sorted(
+            (stable_hash(f"{shard}#{replica}"), shard) for shard in self.shards for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for_partition(self, partition: int) -> str:
+        index = bisect.bisect(self._hashes, stable_hash(f"partition-{partition}")) % len(self._hashes)
+        return self._owners[index]
+
+    def shard_for(self, hero_id: int, partition_size: int = PARTITION_SIZE) -> str:
+        return self.shard_for_partition(hero_id // partition_size)
+
+    def partition_queue(self, partition: int, priority: str) -> str:
+        return queue_name(self.shard_for_partition(partition), priority)
+
+    def queue_for(self, hero_id: int, priority: str, partition_size: int = PARTITION_SIZE) -> str:
+        return self.partition_queue(hero_id // partition_size, priority)
+
+
+def load_ring(connection):
+    shards = connection.smembers(SHARDS_KEY)
+    return HashRing(shard.decode() for shard in shards) if shards else None
+
+
+class RingCache:
+    """The ring as last read from Redis, reread after ``RING_TTL`` seconds."""
+
+    def __init__(self, connection, ttl: float = RING_TTL):
+        self.connection = connection
+        self.ttl = ttl
+        self._ring = None
+        self._loaded = None
+
+    def get(self):
+        now = time.monotonic()
+        if self._loaded is None or now - self._loaded > self.ttl:
+            self._loaded = now  # after a failed read the previous ring is kept until the next one
+            self._ring = load_ring(self.connection)
+        return self._ring
+
+    def queue_for(self, hero_id: int, priority: str) -> str:
+        ring = self.get()
+        return ring.queue_for(hero_id, priority) if ring else priority
+
+
+def job_partition(job, partition_size: int = PARTITION_SIZE):
+    """The hero range a job works on, None for jobs without hero affinity."""
+    index = HERO_JOBS.get(job.func_name)
+    if index is None or len(job.args) <= index:
+        return None
+    return job.args[index] // partition_size
+
+
+def move_jobs(connection, ring, queue_names, partition_size: int = PARTITION_SIZE) -> int:
+    """Move queued hero jobs of ``queue_names`` to the queue of their shard on ``ring`` (None: unsharded)."""
+    moved = 0
+    targets = {}
+    for name in queue_names:
+        priority = name.partition("-")[0]
+        source = Queue(name, connection=connection)
+        for job in source.get_jobs():
+            partition = job_partition(job, partition_size)
+            if partition is None:
+                continue
+            target = ring.partition_queue(partition, priority) if ring else priority
+            if target != name:
+                if target not in targets:
+                    targets[target] = Queue(target, connection=connection)
+                source.remove(job)
+                targets[target].enqueue_job(job)
+                moved += 1
+    return moved
+
+
+def rebalance(connection, shards, settle: float = RING_TTL, partition_size: int = PARTITION_SIZE) -> int:
+    """Switch to ``shards`` and move the queued jobs that now belong elsewhere; returns how many moved.
+
+    Waits ``settle`` seconds between publishing the shards and moving jobs, so that processes still
+    dispatching with the old ring have reread it; the jobs they queued meanwhile are moved too.
+    Workers of removed shards can be stopped once rebalance returned and their running job ended.
+    """
+    old_ring = load_ring(connection)
+    ring = HashRing(shards) if shards else None
+    with connection.pipeline() as pipeline:
+        pipeline.delete(SHARDS_KEY)
+        if ring:
+            pipeline.sadd(SHARDS_KEY, *ring.shards)
+        pipeline.execute()
+    time.sleep(settle)
+    sources = list(PRIORITIES)
+    for shard in set(old_ring.shards if old_ring else ()) | set(ring.shards if ring else ()):
+        sources += [queue_name(shard, priority) for priority in PRIORITIES]
+    return move_jobs(connection, ring, sources, partition_size)
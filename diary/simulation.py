@@ -0,0 +1,170 @@
+"""Vectorized simulation of many heroes at once, for offline balance and load studies.
+
+Heroes live in NumPy arrays instead of the ORM. Every tick each hero whose next action still fits
+before ``until`` performs it, following the same state machine and rules as ``diary.views.Diary``.
+Selling the stash is resolved as one step per hero: the gold and time are the same as selling
+item by item because the price only depends on the level, which does not change in town.
+"""
+
+import numpy as np
+
+from diary import consts, models
+
+SLOTS = np.array([slot for slot, _ in models.Equipment.SLOTS])
+ACTIONS = list(consts.ActionType)
+ACTION_TIME = np.array([consts.ACTION_SPEED[action] for action in ACTIONS])
+SELL_ITEM = ACTIONS.index(consts.ActionType.SELL_ITEM)
+BUY_EQUIPMENT = ACTIONS.index(consts.ActionType.BUY_EQUIPMENT)
+TRAVEL_TO_KILLING_FIELD = ACTIONS.index(consts.ActionType.TRAVEL_TO_KILLING_FIELD)
+KILLING_FIELD = ACTIONS.index(consts.ActionType.KILLING_FIELD)
+KILL_MONSTER = ACTIONS.index(consts.ActionType.KILL_MONSTER)
+TRAVEL_TO_TOWN = ACTIONS.index(consts.ActionType.TRAVEL_TO_TOWN)
+TOWN = ACTIONS.index(consts.ActionType.TOWN)
+LEVEL_THRESHOLDS = np.array(models.LEVEL_THRESHOLDS)
+MOVES = {ACTIONS.index(action_type): location for action_type, (location, _) in consts.MOVES.items()}
+
+
+def item_quality(rolls):
+    quality = np.zeros_like(rolls)
+    for min_roll, value in reversed(consts.ITEM_QUALITY_THRESHOLDS):
+        quality[rolls >= min_roll] = value
+    return quality
+
+
+def level_for_experience(experience):
+    return np.searchsorted(LEVEL_THRESHOLDS, experience)
+
+
+class BatchSimulation:
+    def __init__(self, attributes, seed=None):
+        """``attributes`` is an (n, 5) array in ``consts.ATTRIBUTES`` order."""
+        count = len(attributes)
+        self.rng = np.random.default_rng(seed)
+        self.attributes = np.array(attributes, dtype=np.int64)
+        self.experience = np.zeros(count, dtype=np.int64)
+        self.gold = np.zeros(count, dtype=np.int64)
+        self.location = np.full(count, consts.LOCATION_TOWN)
+        self.clock = np.zeros(count, dtype=np.int64)  # seconds since the simulation started
+        self.stash = np.zeros(count, dtype=np.int64)
+        self.stash_quality = np.zeros(count, dtype=np.int64)
+        # 0 marks an empty slot, otherwise prefix and suffix as on models.Equipment.
+        self.prefix = np.zeros((count, len(SLOTS)), dtype=np.int64)
+        self.suffix = np.zeros((count, len(SLOTS)), dtype=np.int64)
+        self.kills = np.zeros(count, dtype=np.int64)
+
+    @classmethod
+    def random(cls, count, seed=None):
+        rng = np.random.default_rng(seed)
+        return cls(rng.integers(3, 19, size=(count, len(consts.ATTRIBUTES))), seed=seed)
+
+    @classmethod
+    def from_heroes(cls, heroes, seed=None):
+        return cls([[getattr(hero, name) for name in consts.ATTRIBUTES] for hero in heroes], seed=seed)
+
+    @property
+    def capacity(self):
+        return self.attributes[:, consts.ATTRIBUTES.index("strength")] + consts.BASE_CAPACITY
+
+    @property
+    def level(self):
+        return level_for_experience(self.experience)
+
+    def upgrade_prices(self, heroes=slice(None)):
+        prefix, suffix = self.prefix[heroes], self.suffix[heroes]
+        return np.where(prefix > 0, models.Equipment.upgrade_price(prefix, suffix, SLOTS), 1)
+
+    @property
+    def equipment_score(self):
+        return (self.prefix * self.suffix * SLOTS).sum(axis=1)
+
+    def predict_actions(self):
+        in_town = self.location == consts.LOCATION_TOWN
+        can_buy = (self.upgrade_prices() <= self.gold[:, None]).any(axis=1)
+        town = np.where(self.stash > 0, SELL_ITEM, np.where(can_buy, BUY_EQUIPMENT, TRAVEL_TO_KILLING_FIELD))
+        fields = np.where(self.stash < self.capacity, KILL_MONSTER, TRAVEL_TO_TOWN)
+        in_fields = self.location == consts.LOCATION_KILLING_FIELDS
+        actions = np.full(len(self.location), TOWN)
+        actions[self.location == consts.LOCATION_ROAD_KILLING_FIELDS] = KILLING_FIELD
+        actions[in_fields] = fields[in_fields]
+        actions[in_town] = town[in_town]
+        return actions
+
+    def tick(self, until):
+        actions = self.predict_actions()
+        # The whole stash is sold at once, one second per item, and every affordable slot bought at once.
+        steps = np.select([actions == SELL_ITEM, actions == BUY_EQUIPMENT], [self.stash, self.purchases()], 1)
+        durations = ACTION_TIME[actions] * steps
+        active = self.clock + durations < until
+        for action in range(len(ACTIONS)):
+            heroes = np.flatnonzero(active & (actions == action))
+            if not len(heroes):
+                continue
+            if action in MOVES:
+                self.location[heroes] = MOVES[action]
+                self.clock[heroes] += ACTION_TIME[action]
+            elif action == KILL_MONSTER:
+                self.kill_monsters(heroes)
+            elif action == SELL_ITEM:
+                self.sell_items(heroes)
+            else:
+                self.buy_equipments(heroes)
+        return int(active.sum())
+
+    def run(self, seconds):
+        until = self.clock.max(initial=0) + seconds
+        ticks = 0
+        while self.tick(until):
+            ticks += 1
+        return ticks
+
+    def kill_monsters(self, heroes):
+        count = len(heroes)
+        low, high = consts.EXPERIENCE_PER_KILL
+        self.experience[heroes] += self.rng.integers(low, high + 1, size=count)
+        self.clock[heroes] += ACTION_TIME[KILL_MONSTER]
+        lucky = heroes[self.rng.integers(1, consts.ATTRIBUTE_ROLL + 1, size=count) == consts.ATTRIBUTE_ROLL]
+        np.add.at(self.attributes, (lucky, self.rng.integers(0, len(consts.ATTRIBUTES), size=len(lucky))), 1)
+        self.stash[heroes] += 1
+        self.stash_quality[heroes] += item_quality(self.rng.integers(1, consts.ITEM_QUALITY_ROLL + 1, size=count))
+        self.kills[heroes] += 1
+
+    def sell_items(self, heroes):
+        self.gold[heroes] += self.level[heroes] * self.stash_quality[heroes]
+        self.clock[heroes] += ACTION_TIME[SELL_ITEM] * self.stash[heroes]
+        self.stash[heroes] = 0
+        self.stash_quality[heroes] = 0
+
+    def purchases(self):
+        """Slots each hero would buy on entering the shop, see buy_equipments."""
+        prices = self.upgrade_prices()
+        gold = self.gold.copy()
+        count = np.zeros(len(gold), dtype=int)
+        for index in range(len(SLOTS)):
+            affordable = prices[:, index] <= gold
+            gold -= np.where(affordable, prices[:, index], 0)
+            count += affordable
+        return count
+
+    def buy_equipments(self, heroes):
+        # Same as Diary.buy_equipments: prices are fixed when entering the shop, slots bought in order.
+        prices = self.upgrade_prices(heroes)
+        for index in range(len(SLOTS)):
+            affordable = prices[:, index] <= self.gold[heroes]
+            buying = heroes[affordable]
+            self.gold[buying] -= prices[affordable, index]
+            self.clock[buying] += ACTION_TIME[BUY_EQUIPMENT]
+            prefix, suffix = self.prefix[buying, index], self.suffix[buying, index]
+            new = prefix == 0
+            upgrade_suffix = ~new & (prefix > suffix)
+            self.prefix[buying, index] = np.where(new, 1, np.where(upgrade_suffix, prefix, prefix * 4))
+            self.suffix[buying, index] = np.where(new, 1, np.where(upgrade_suffix, suffix * 4, suffix))
+
+    def statistics(self):
+        return {
+            "heroes": len(self.clock),
+            "experience": float(self.experience.mean()),
+            "level": float(self.level.mean()),
+            "gold": float(self.gold.mean()),
+            "kills": float(self.kills.mean()),
+            "equipment_score": float(self.equipment_score.mean()),
+        }
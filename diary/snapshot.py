@@ -0,0 +1,139 @@
+"""Hero snapshots: every hero with stash and equipment in one packed binary stream.
+
+A snapshot is ``HEADER`` followed by one record per hero: ``HERO_FORMAT``, the UTF-8 name, the
+nine equipment slots as packed by diary.equipment, then ``ITEM_FORMAT`` per stash item (index in
+consts.LIST_OF_ITEMS, quality, quantity). Heroes are read and written a batch at a time, so memory
+stays constant however many heroes there are; paths ending in .gz are gzip-compressed.
+Diary entries are not part of a snapshot, and stored stats are recomputed on load.
+"""
+
+import gzip
+import struct
+from datetime import datetime, timedelta, timezone
+
+from diary import consts, models
+from diary.equipment import SLOT_FORMAT, SLOTS, pack, packed_storage, unpack
+
+MAGIC = b"HEROSNAP"
+VERSION = 1
+HEADER = struct.Struct("<8sH")
+HERO_FIELDS = (
+    "id",
+    "experience",
+    "strength",
+    "agility",
+    "vitality",
+    "wisdom",
+    "charisma",
+    "gold",
+    "last_action",  # microseconds since EPOCH
+    "location",
+    "stash_count",
+    "rng_seed",
+    "rng_position",
+)
+LAST_ACTION = HERO_FIELDS.index("last_action")
+HERO_FORMAT = struct.Struct("<qqiiiiiqqBiqq" + "HH")  # HERO_FIELDS, name length, item count
+ITEM_FORMAT = struct.Struct("<HBi")
+EQUIPMENT_SIZE = SLOT_FORMAT.size * len(SLOTS)
+BATCH_SIZE = 1000
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ITEM_INDEX = {name: index for index, name in enumerate(consts.LIST_OF_ITEMS)}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def open_snapshot(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def hero_batches(batch_size: int = BATCH_SIZE):
+    """Hero rows a batch at a time, with the packed equipment and stash rows of the batch.
+
+    Plain value rows instead of models and prefetch_related, which cost several times the encoding.
+    """
+    heroes = models.Hero.objects.order_by("id").values_list(*HERO_FIELDS, "name", "equipment_packed")
+    batch = list(heroes[:batch_size])
+    while batch:
+        ids = [row[0] for row in batch]
+        items = {}
+        for owner, name, quality, quantity in models.Item.objects.filter(owner__in=ids).values_list(
+            "owner", "name", "quality", "quantity"
+        ):
+            items.setdefault(owner, []).append(ITEM_FORMAT.pack(ITEM_INDEX[name], quality, quantity))
+        equipments = {}
+        for equipment in models.Equipment.objects.filter(owner__in=[row[0] for row in batch if row[-1] is None]):
+            equipments.setdefault(equipment.owner_id, {})[equipment.slot] = equipment
+        yield [
+            (row, bytes(row[-1]) if row[-1] is not None else pack(equipments.get(row[0], {})), items.get(row[0], []))
+            for row in batch
+        ]
+        batch = list(heroes.filter(id__gt=ids[-1])[:batch_size])
+
+
+def pack_hero(row: tuple, equipment: bytes, items: list) -> bytes:
+    *values, name, _ = row
+    name = name.encode()
+    values[LAST_ACTION] = (values[LAST_ACTION] - EPOCH) // timedelta(microseconds=1)
+    return b"".join([HERO_FORMAT.pack(*values, len(name), len(items)), name, equipment, *items])
+
+
+def write_snapshot(stream, batch_size: int = BATCH_SIZE):
+    """Write every hero to ``stream``, yielding the running total after each batch."""
+    stream.write(HEADER.pack(MAGIC, VERSION))
+    written = 0
+    for batch in hero_batches(batch_size):
+        stream.write(b"".join(pack_hero(*record) for record in batch))
+        written += len(batch)
+        yield written
+
+
+def read_exactly(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise SnapshotError("Snapshot is truncated")
+    return data
+
+
+def read_heroes(stream, keep_ids: bool = False):
+    """Yield (hero, equipments, items) for every record, all unsaved."""
+    magic, version = HEADER.unpack(read_exactly(stream, HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotError(f"Not a version {VERSION} hero snapshot")
+    while True:
+        data = stream.read(HERO_FORMAT.size)
+        if not data:
+            return
+        if len(data) != HERO_FORMAT.size:
+            raise SnapshotError("Snapshot is truncated")
+        *values, name_length, item_count = HERO_FORMAT.unpack(data)
+        values = dict(zip(HERO_FIELDS, values))
+        values["last_action"] = EPOCH + timedelta(microseconds=values["last_action"])
+        if not keep_ids:
+            values["id"] = None
+        hero = models.Hero(name=read_exactly(stream, name_length).decode(), **values)
+        equipments = unpack(hero, read_exactly(stream, EQUIPMENT_SIZE))
+        items = [
+            models.Item(owner=hero, name=consts.LIST_OF_ITEMS[index], quality=quality, quantity=quantity)
+            for index, quality, quantity in ITEM_FORMAT.iter_unpack(read_exactly(stream, ITEM_FORMAT.size * item_count))
+        ]
+        yield hero, equipments, items
+
+
+def load_batch(records: list):
+    """Bulk insert one batch of read_heroes records; the caller provides the transaction."""
+    packed = packed_storage()
+    for hero, equipments, _ in records:
+        hero.refresh_stats()
+        hero.equipment_score = sum(equipment.price for equipment in equipments.values())
+        hero.equipment_packed = pack(equipments) if packed else None
+    models.Hero.objects.bulk_create([hero for hero, _, _ in records])
+    models.Item.objects.bulk_create([item for _, _, items in records for item in items])
+    if not packed:
+        models.Equipment.objects.bulk_create(
+            [equipment for _, equipments, _ in records for equipment in equipments.values()]
+        )
@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import F
+
+from diary import leaderboard, models
+from diary.equipment import load_equipments, pack, packed_storage
+
+
+class StaleHeroError(Exception):
+    """Another run flushed the hero after this state was loaded; nothing was written."""
+
+
+class HeroState:
+    """Unit of work for one diary run.
+
+    Stash and equipment are loaded once; every change and diary entry is kept in memory and
+    written by ``flush`` in a single transaction, which also refreshes the leaderboards.
+    The hero row is updated only if its version is still the one loaded (compare-and-swap), so
+    two concurrent runs of the same hero cannot both apply.
+    """
+
+    def __init__(self, hero: models.Hero):
+        self.hero = hero
+        self.items = {(item.name, item.quality): item for item in hero.items.all()}
+        self.equipments = load_equipments(hero)
+        self.entries = []
+        self._sold_items = []
+        self._changed_items = set()
+        self._changed_equipments = set()
+        self._packed = packed_storage()
+        self._equipment_rows = hero.equipment_packed is None and bool(self.equipments)
+        # Moving back to rows: every unpacked slot has to be inserted. The packed value is only
+        # cleared by flush, a run without actions leaves the hero as it is stored.
+        self._unpack = not self._packed and hero.equipment_packed is not None
+        if self._unpack:
+            self._changed_equipments = set(self.equipments)
+
+    def log(self, event: int, arg1: int = 0, arg2: int = 0, arg3: int = 0):
+        offset = models.DiaryEntry.offset_for(self.hero.last_action)
+        self.entries.append(
+            models.DiaryEntry(hero=self.hero, event=event, offset=offset, arg1=arg1, arg2=arg2, arg3=arg3)
+        )
+
+    def add_item(self, quality: int, name: str) -> models.Item:
+        item = self.items.get((name, quality))
+        if item is None:
+            item = self.items[name, quality] = models.Item(quality=quality, name=name, owner=self.hero, quantity=0)
+        item.quantity += 1
+        self.hero.stash_count += 1
+        self._changed_items.add((name, quality))
+        return item
+
+    def sell_all(self):
+        sold = list(self.items.values())
+        self._sold_items += [item.pk for item in sold if item.pk is not None]
+        self.items = {}
+        self._changed_items = set()
+        self.hero.stash_count = 0
+        return sold
+
+    def set_equipment(self, slot: int, prefix: int, suffix: int) -> models.Equipment:
+        equipment = self.equipments.get(slot)
+        if equipment is None:
+            equipment = models.Equipment(prefix=prefix, suffix=suffix, slot=slot, owner=self.hero, modifier=0)
+            self.equipments[slot] = equipment
+        else:
+            equipment.prefix, equipment.suffix = prefix, suffix
+        self._changed_equipments.add(slot)
+        return equipment
+
+    def save_hero(self):
+        self.hero.equipment_score = sum(equipment.price for equipment in self.equipments.values())
+        fields = {
+            field.attname: getattr(self.hero, field.attname)
+            for field in models.Hero._meta.concrete_fields
+            if not field.primary_key and field.attname != "version"
+        }
+        updated = models.Hero.objects.filter(pk=self.hero.pk, version=self.hero.version).update(
+            version=F("version") + 1, **fields
+        )
+        if not updated:
+            raise StaleHeroError(f"Hero {self.hero.pk} changed since version {self.hero.version}")
+        self.hero.version += 1
+
+    def flush(self):
+        changed_items = [self.items[key] for key in sorted(self._changed_items)]
+        new_items = [item for item in changed_items if item.pk is None]
+        added_items = [item for item in changed_items if item.pk is not None]
+        changed = [self.equipments[slot] for slot in sorted(self._changed_equipments)]
+        new_equipments = [equipment for equipment in changed if equipment.pk is None]
+        upgraded_equipments = [equipment for equipment in changed if equipment.pk is not None]
+        moved_rows = self._packed and self._equipment_rows
+        if self._packed:
+            self.hero.equipment_packed = pack(self.equipments)
+            new_equipments, upgraded_equipments = [], []
+        elif self._unpack:
+            self.hero.equipment_packed = None
+        with transaction.atomic():
+            self.save_hero()
+            if moved_rows:
+                self.hero.equipments.all().delete()
+            if self._sold_items:
+                models.Item.objects.filter(pk__in=self._sold_items).delete()
+            models.Item.objects.bulk_create(new_items)
+            models.Item.objects.bulk_update(added_items, ["quantity"])
+            models.Equipment.objects.bulk_create(new_equipments)
+            models.Equipment.objects.bulk_update(upgraded_equipments, ["prefix", "suffix"])
+            models.DiaryEntry.objects.bulk_create(self.entries)
+        leaderboard.update(self.hero)
+        self.entries = []
+        self._sold_items = []
+        self._changed_items = set()
+        self._changed_equipments = set()
+        self._equipment_rows = self._equipment_rows and not moved_rows
+        self._unpack = False
+        # Backends that do not return primary keys from bulk_create leave new rows without pk.
+        if any(item.pk is None for item in new_items):
+            self.items = {(item.name, item.quality): item for item in self.hero.items.all()}
+        if any(equipment.pk is None for equipment in new_equipments):
+            self.equipments = {equipment.slot: equipment for equipment in self.hero.equipments.all()}
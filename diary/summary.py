@@ -0,0 +1,36 @@
+from diary import models
+
+# Hero columns the index page shows; every flush keeps them current, so summaries need no cache
+# that the worker's flushes would have to reach.
+SUMMARY_FIELDS = (
+    "id",
+    "name",
+    "last_action",
+    "strength",
+    "agility",
+    "vitality",
+    "wisdom",
+    "charisma",
+    "level",
+    "gold",
+    "location",
+    "stash_count",
+    "capacity",
+    "equipment_score",
+)
+
+
+def build_summary(hero: models.Hero) -> dict:
+    return {
+        "level": hero.level,
+        "gold": hero.gold,
+        "location": hero.get_location_display(),
+        "stash": hero.stash_count,
+        "capacity": hero.capacity,
+        "equipment_score": hero.equipment_score,
+    }
+
+
+def get_summaries(heroes):
+    """Pairs every hero, loaded with at least SUMMARY_FIELDS, with its summary."""
+    return [(hero, build_summary(hero)) for hero in heroes]
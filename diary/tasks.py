@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Max, Min
+from rq import Queue
+from rq.job import JobStatus
+
+from diary import metrics, models
+from diary.views import advance
+
+PARTITION_SIZE = 500
+PENDING_STATUSES = (JobStatus.QUEUED, JobStatus.STARTED, JobStatus.DEFERRED, JobStatus.SCHEDULED)
+
+
+def hero_partitions(partition_size: int = PARTITION_SIZE):
+    bounds = models.Hero.objects.aggregate(first=Min("id"), last=Max("id"))
+    if bounds["first"] is None:
+        return
+    # Partitions are aligned to partition_size so a range keeps its job id between ticks.
+    first_id = bounds["first"] - bounds["first"] % partition_size
+    for start in range(first_id, bounds["last"] + 1, partition_size):
+        yield start, start + partition_size
+
+
+def partition_job_id(first_id: int, last_id: int) -> str:
+    return f"advance-heroes-{first_id}-{last_id}"
+
+
+def advance_hero(hero_id: int):
+    hero = models.Hero.objects.filter(id=hero_id).first()
+    try:
+        if hero is not None:
+            advance(hero)
+    finally:
+        metrics.push(force=True)  # a forked job's process ends with the job
+
+
+def advance_heroes(first_id: int, last_id: int) -> int:
+    """Advance the heroes of a range, except those that acted within the last tick."""
+    counter = 0
+    idle = datetime.now(timezone.utc) - timedelta(seconds=settings.DIARY_TICK_SECONDS)
+    heroes = models.Hero.objects.filter(id__gte=first_id, id__lt=last_id, last_action__lt=idle)
+    try:
+        for hero in heroes.iterator():
+            counter += advance(hero)
+    finally:
+        metrics.push(force=True)
+    return counter
+
+
+def schedule_advance_heroes(queue: Queue, partition_size: int = PARTITION_SIZE, ring=None):
+    """Enqueue one job per hero range on ``queue``, or on the low queue of its shard of ``ring``."""
+    scheduled = []
+    queues = {}
+    for first_id, last_id in hero_partitions(partition_size):
+        job_id = partition_job_id(first_id, last_id)
+        target = queue
+        if ring is not None:
+            name = ring.partition_queue(first_id // partition_size, "low")
+            target = queues.setdefault(name, Queue(name, connection=queue.connection))
+        job = target.fetch_job(job_id)
+        if job is not None and job.get_status() in PENDING_STATUSES:
+            continue  # previous tick for this range has not finished yet
+        target.enqueue(advance_heroes, first_id, last_id, job_id=job_id, result_ttl=0)
+        scheduled.append((first_id, last_id))
+    return scheduled
@@ -1,94 +1,200 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from random import choice, randint
-from types import FunctionType
-from typing import Dict
-
-from django.shortcuts import get_object_or_404, redirect, render
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import close_old_connections
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views import View
-from faker import Faker
 
-from diary import consts, models
+from diary import consts, leaderboard, metrics, models
+from diary.equipment import aload_equipments, load_equipments
+from diary.fast_forward import FastForward
+from diary.heroes import create_heroes, names, new_hero
+from diary.state import HeroState, StaleHeroError
+from diary.summary import SUMMARY_FIELDS, get_summaries
 
-fake = Faker(["pl_PL", "sv_SE", "hi_IN"])
 
-from rq import Queue
-from worker import conn
+class StartView(View):
+    PAGE_SIZE = 30
 
+    def get(self, request):
+        heroes = list(self.get_heroes(request.GET.get("after", "")))
+        return self.render_page(request, heroes, get_summaries(heroes[: self.PAGE_SIZE]))
 
+    def get_heroes(self, after: str):
+        """One hero more than a page, to know whether there is a next one."""
+        heroes = models.Hero.objects.only(*SUMMARY_FIELDS).order_by("id")
+        if after.isdigit():
+            heroes = heroes.filter(id__gt=int(after))
+        return heroes[: self.PAGE_SIZE + 1]
 
-class StartView(View):
-    def get(self, request):
-        heroes = models.Hero.objects.all()
-        from utils import count_words_at_url
-        q = Queue(connection=conn)
-        result = q.enqueue(count_words_at_url, 'http://heroku.com')
-        return render(request, "index.html", context={"heroes": heroes})
+    def render_page(self, request, heroes, summaries):
+        next_after = heroes[self.PAGE_SIZE - 1].id if len(heroes) > self.PAGE_SIZE else None
+        with metrics.timed(metrics.RENDER_SECONDS, "index.html", enabled=metrics.sampled()):
+            return render(request, "index.html", context={"heroes": summaries, "next_after": next_after})
 
 
 class CreateHero(View):
     def get(self, request):
-        models.Hero.objects.create(
-            name=fake.name(),
-            strength=randint(3, 18),
-            agility=randint(3, 18),
-            vitality=randint(3, 18),
-            wisdom=randint(3, 18),
-            charisma=randint(3, 18),
-            gold=0,
-            last_action=datetime.now(),
-        )
+        new_hero(names.take()[0], datetime.now(timezone.utc)).save()
         return redirect("index")
 
 
+class CreateHeroes(View):
+    """Staff-only bulk creation for load tests; streams the running total after every chunk."""
+
+    MAX_COUNT = 100000
+
+    def post(self, request):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        count = request.POST.get("count", "")
+        if not count.isdigit() or not 0 < int(count) <= self.MAX_COUNT:
+            return HttpResponseBadRequest(f"count must be between 1 and {self.MAX_COUNT}")
+        progress = (f"{created}\n" for created in create_heroes(int(count)))
+        return StreamingHttpResponse(progress, content_type="text/plain")
+
+
+class Leaderboard(View):
+    def get(self, request):
+        board = request.GET.get("board", "level")
+        if board not in leaderboard.BOARDS:
+            return HttpResponseBadRequest(f"board must be one of {', '.join(leaderboard.BOARDS)}")
+        context = {"board": board, "boards": list(leaderboard.BOARDS), "entries": leaderboard.top(board)}
+        with metrics.timed(metrics.RENDER_SECONDS, "leaderboard.html", enabled=metrics.sampled()):
+            return render(request, "leaderboard.html", context=context)
+
+
 class Action:
     def __init__(self, action_type: consts.ActionType):
         self.action_type = action_type
+        self.index = action_type.value
+        self.time = consts.ACTION_SPEED.get(action_type, 0)
+        self.duration = timedelta(seconds=self.time)
+        self.location, self.event = consts.MOVES.get(action_type, (None, None))
 
-    @property
-    def time(self):
-        return consts.ACTION_SPEED.get(self.action_type, 0)
+
+ACTIONS = {action_type: Action(action_type) for action_type in consts.ActionType}
+
+
+def dispatch_table(handlers) -> list:
+    table = [None] * (max(action_type.value for action_type in consts.ActionType) + 1)
+    for action_type, handler in handlers.items():
+        table[action_type.value] = handler
+    return table
 
 
 class Diary:
     MAX_ACTION_COUNT = 100
 
-    def __init__(self, hero: models.Hero):
+    def __init__(self, hero: models.Hero, fast_forward: bool = False):
         self._hero = hero
-        self.messages = []
-
-    def process_story(self):
+        self._state = HeroState(hero)
+        self.fast_forward = fast_forward
+        self._prediction = None
+        self.caught_up = False
+        self.action_counts = [0] * len(self.HANDLERS)
+
+    def process_story(self, until: Optional[datetime] = None, deadline: Optional[float] = None):
+        """Run the actions that finish before ``until`` (default: now).
+
+        Stops early after MAX_ACTION_COUNT actions or once ``time.monotonic()`` passes
+        ``deadline``; ``caught_up`` then stays False and ``hero.last_action`` marks how far the
+        story got, so another run can continue from there.
+        """
+        if until is None:
+            until = datetime.now(timezone.utc)
+        start = time.perf_counter()
         counter = 0
-        while self.can_do_next_action() and counter < self.MAX_ACTION_COUNT:
+        actions = sum(self.action_counts)
+        forwarded = not self.fast_forward
+        while self.can_do_next_action(until):
+            if counter >= self.MAX_ACTION_COUNT or (deadline is not None and time.monotonic() >= deadline):
+                break
             action = self.predict_action()
+            if not forwarded and action.action_type == consts.ActionType.TRAVEL_TO_KILLING_FIELD:
+                forwarded = True
+                self.forward_cycles(until, deadline)
+                continue
             self.make_action(action)
             counter += 1
-        self._hero.save()  # Save hero only one
-
-    def can_do_next_action(self):
-        action = self.predict_action()
-        timedelta_from_last_action = datetime.now(timezone.utc) - self._hero.last_action
-        return timedelta(seconds=action.time) < timedelta_from_last_action
+        else:
+            self.caught_up = True
+        if sum(self.action_counts) > actions:
+            # Save hero, stash, equipment and diary entries only once, and not at all when nothing
+            # happened: the version, and with it the page ETag and cached fragments, stays the same.
+            self._state.flush()
+        metrics.record_run(self.action_counts, time.perf_counter() - start)
+        return counter
+
+    def forward_cycles(self, until: datetime, deadline: Optional[float] = None):
+        fast_forward = FastForward(self._state)
+        if not fast_forward.run(until, deadline):
+            return
+        self.state_changed()
+        self.count_cycles(fast_forward)
+        fast_forward.apply_equipment()
+        self._state.log(consts.EVENT_TRIPS, fast_forward.cycles, fast_forward.kills, fast_forward.gold_earned)
+        if fast_forward.bought:
+            self._state.log(consts.EVENT_TRIPS_EQUIPMENT, fast_forward.bought)
+        for attribute, count in fast_forward.attributes.items():
+            self._state.log(consts.EVENT_ATTRIBUTE, consts.ATTRIBUTES.index(attribute), count)
+
+    def count_cycles(self, fast_forward: FastForward):
+        for action_type in consts.MOVES:
+            self.action_counts[action_type.value] += fast_forward.cycles
+        self.action_counts[consts.ActionType.SELL_ITEM.value] += fast_forward.cycles
+        self.action_counts[consts.ActionType.KILL_MONSTER.value] += fast_forward.kills
+        self.action_counts[consts.ActionType.BUY_EQUIPMENT.value] += fast_forward.bought
+
+    def state_changed(self):
+        self._prediction = None
+
+    def can_do_next_action(self, until: Optional[datetime] = None):
+        if until is None:
+            until = datetime.now(timezone.utc)
+        return self.action_duration(self.predict_action()) < until - self._hero.last_action
+
+    def action_duration(self, action: Action) -> timedelta:
+        if action.action_type == consts.ActionType.SELL_ITEM:
+            return action.duration * self._hero.stash_count  # the whole stash is sold at once
+        if action.action_type == consts.ActionType.BUY_EQUIPMENT:
+            return action.duration * len(self.purchases())
+        return action.duration
 
     def predict_action(self) -> Action:
-        if self._hero.location == consts.LOCATION_TOWN:
-            return self.predict_action_in_town()
-        if self._hero.location == consts.LOCATION_ROAD_KILLING_FIELDS:
-            return Action(consts.ActionType.KILLING_FIELD)
-        if self._hero.location == consts.LOCATION_KILLING_FIELDS:
-            return self.predict_action_in_killing_fields()
-        return Action(consts.ActionType.TOWN)
+        """The next action, decided once per state change."""
+        if self._prediction is None:
+            location = self._hero.location
+            if location == consts.LOCATION_TOWN:
+                self._prediction = self.predict_action_in_town()
+            elif location == consts.LOCATION_KILLING_FIELDS:
+                self._prediction = self.predict_action_in_killing_fields()
+            else:
+                self._prediction = ACTIONS[consts.ROAD_ACTIONS.get(location, consts.ActionType.TOWN)]
+        return self._prediction
 
     def predict_action_in_killing_fields(self) -> Action:
-        if self._hero.items.count() < self._hero.capacity:
-            return Action(consts.ActionType.KILL_MONSTER)
-        return Action(consts.ActionType.TRAVEL_TO_TOWN)
+        if self._hero.stash_count < self._hero.capacity:
+            return ACTIONS[consts.ActionType.KILL_MONSTER]
+        return ACTIONS[consts.ActionType.TRAVEL_TO_TOWN]
 
     def predict_action_in_town(self) -> Action:
-        if self._hero.items.count() > 0:
-            return Action(consts.ActionType.SELL_ITEM)
+        if self._hero.stash_count > 0:
+            return ACTIONS[consts.ActionType.SELL_ITEM]
         if self.can_buy_equipment():
-            return Action(consts.ActionType.BUY_EQUIPMENT)
-        return Action(consts.ActionType.TRAVEL_TO_KILLING_FIELD)
+            return ACTIONS[consts.ActionType.BUY_EQUIPMENT]
+        return ACTIONS[consts.ActionType.TRAVEL_TO_KILLING_FIELD]
 
     def can_buy_equipment(self) -> bool:
         price_for_slot_upgrade = self.get_price_for_upgrade()
@@ -98,104 +204,233 @@ class Diary:
         return False
 
     def get_price_for_upgrade(self):
-        equipments = self._hero.equipments.all()
         price_for_slot_upgrade = {k: 1 for k, _ in models.Equipment.SLOTS}
-        for equipment in equipments:
+        for equipment in self._state.equipments.values():
             price_for_slot_upgrade[equipment.slot] = equipment.price_next
         return price_for_slot_upgrade
 
     def make_action(self, action: Action):
-        actions: Dict[consts.ActionType, FunctionType] = {
-            consts.ActionType.SELL_ITEM: self.sell_item,
-            consts.ActionType.BUY_EQUIPMENT: self.buy_equipments,
-            consts.ActionType.TRAVEL_TO_KILLING_FIELD: self.travel_to_killing_field,
-            consts.ActionType.KILLING_FIELD: self.killing_field,
-            consts.ActionType.KILL_MONSTER: self.action_kill_monster,
-            consts.ActionType.TRAVEL_TO_TOWN: self.action_travel_to_town,
-            consts.ActionType.TOWN: self.action_in_town,
-        }
-
-        action_method = actions.get(action.action_type)
-        if action_method:
-            action_method(action)
-
-    def buy_equipments(self, action: Action):
+        self.action_counts[action.index] += 1
+        handler = self.HANDLERS[action.index]
+        if handler:
+            handler(self, action)
+        self.state_changed()
+
+    def purchases(self) -> list:
+        """Slots and prices bought on entering the shop: prices are fixed then, slots bought in order."""
+        gold = self._hero.gold
+        bought = []
         for slot, value in self.get_price_for_upgrade().items():
-            if value <= self._hero.gold:
-                equipment = self.buy_equipment(slot, value)
-                self._hero.last_action += timedelta(seconds=action.time)
-                self.messages.append(f"{self._hero.last_action} - buy equipment {equipment}")
+            if value <= gold:
+                gold -= value
+                bought.append((slot, value))
+        return bought
 
-    def action_in_town(self, action: Action):
-        self._hero.location = consts.LOCATION_TOWN
-        self._hero.last_action += timedelta(seconds=action.time)
-        self.messages.append(f"{self._hero.last_action} - in  Town")
+    def buy_equipments(self, action: Action):
+        for slot, value in self.purchases():
+            equipment = self.buy_equipment(slot, value)
+            self._hero.last_action += action.duration
+            self._state.log(consts.EVENT_BUY_EQUIPMENT, equipment.slot, equipment.prefix, equipment.suffix)
 
-    def action_travel_to_town(self, action: Action):
-        self._hero.location = consts.LOCATION_ROAD_TOWN
-        self._hero.last_action += timedelta(seconds=action.time)
-        self.messages.append(f"{self._hero.last_action} - travel to  Town")
+    def move(self, action: Action):
+        self._hero.location = action.location
+        self._hero.last_action += action.duration
+        self._state.log(action.event)
 
     def action_kill_monster(self, action: Action):
-        self._hero.experience += +randint(3, 5)
-        self._hero.last_action += timedelta(seconds=action.time)
-        monster = choice(consts.LIST_OF_MONSTER)
-        self.messages.append(f"{self._hero.last_action} - kill {monster}")
-        if randint(1, 100) > 99:
+        rng = self._hero.rng
+        self._hero.gain_experience(rng.randint(*consts.EXPERIENCE_PER_KILL))
+        self._hero.last_action += action.duration
+        monster = rng.below(len(consts.LIST_OF_MONSTER))
+        self._state.log(consts.EVENT_KILL_MONSTER, monster)
+        if rng.randint(1, consts.ATTRIBUTE_ROLL) == consts.ATTRIBUTE_ROLL:
             attribute = self._hero.add_random_attribute()
-            self.messages.append(f"{self._hero.last_action} - get attribute {attribute}")
+            self._state.log(consts.EVENT_ATTRIBUTE, consts.ATTRIBUTES.index(attribute), 1)
         item = self.generate_item()
-        self.messages.append(f"{self._hero.last_action} - get {item}")
-
-    def killing_field(self, action: Action):
-        self._hero.location = consts.LOCATION_KILLING_FIELDS
-        self._hero.last_action += timedelta(seconds=action.time)
-        self.messages.append(f"{self._hero.last_action} - in  KILLING_FIEL")
-
-    def travel_to_killing_field(self, action: Action):
-        self._hero.location = consts.LOCATION_ROAD_KILLING_FIELDS
-        self._hero.last_action += timedelta(seconds=action.time)
-        self.messages.append(f"{self._hero.last_action} - travel to  KILLING_FIEL")
-
-    def sell_item(self, action: Action):
-        item = self._hero.items.first()
-        self._hero.gold += item.price
-        self._hero.last_action += timedelta(seconds=action.time)
-        self.messages.append(
-            f"{self._hero.last_action} - sell item {item} - price: {item.price} - gold {self._hero.gold}"
-        )
-        item.delete()
+        self._state.log(consts.EVENT_LOOT, consts.LIST_OF_ITEMS.index(item.name), item.quality)
+
+    def sell_items(self, action: Action):
+        items = self._state.sell_all()
+        count = sum(item.quantity for item in items)
+        price = self._hero.level * sum(item.quality * item.quantity for item in items)
+        self._hero.gold += price
+        self._hero.last_action += action.duration * count
+        self._state.log(consts.EVENT_SELL_STASH, count, price)
 
     def buy_equipment(self, slot: int, value: int) -> models.Item:
         self._hero.gold -= value
-        equipment = self._hero.equipments.filter(slot=slot).first()
+        equipment = self._state.equipments.get(slot)
         if equipment:
             if equipment.prefix > equipment.suffix:
-                equipment.suffix *= 4
-            else:
-                equipment.prefix *= 4
-            equipment.save()
-        else:
-            equipment = models.Equipment.objects.create(prefix=1, suffix=1, slot=slot, owner=self._hero, modifier=0)
-        return equipment
+                return self._state.set_equipment(slot, equipment.prefix, equipment.suffix * 4)
+            return self._state.set_equipment(slot, equipment.prefix * 4, equipment.suffix)
+        return self._state.set_equipment(slot, 1, 1)
 
     def generate_item(self) -> models.Item:
-        roll = randint(1, 64)
-        if roll == 64:
-            quality = 64
-        elif roll >= 64 - 4:
-            quality = 16
-        elif roll >= 64 - 16:
-            quality = 4
-        else:
-            quality = 1
-        name = choice(consts.LIST_OF_ITEMS)
-        return models.Item.objects.create(quality=quality, name=name, owner=self._hero)
+        rng = self._hero.rng
+        roll = rng.randint(1, consts.ITEM_QUALITY_ROLL)
+        quality = next(quality for min_roll, quality in consts.ITEM_QUALITY_THRESHOLDS if roll >= min_roll)
+        name = rng.choice(consts.LIST_OF_ITEMS)
+        return self._state.add_item(quality, name)
+
+    HANDLERS = dispatch_table(
+        {
+            consts.ActionType.SELL_ITEM: sell_items,
+            consts.ActionType.BUY_EQUIPMENT: buy_equipments,
+            consts.ActionType.TRAVEL_TO_KILLING_FIELD: move,
+            consts.ActionType.KILLING_FIELD: move,
+            consts.ActionType.KILL_MONSTER: action_kill_monster,
+            consts.ActionType.TRAVEL_TO_TOWN: move,
+            consts.ActionType.TOWN: move,
+        }
+    )
+
+
+def advance(
+    hero: models.Hero, until: Optional[datetime] = None, budget: Optional[float] = None, retries: int = 3
+) -> bool:
+    """Catch the hero up to ``until`` (default: now) with fast-forward enabled.
+
+    ``budget`` limits the wall-clock seconds spent on simulation; whatever is done by then is
+    saved. When another process advances the same hero first, the hero is reloaded with the
+    winner's state and the run is retried. Returns True once the hero reached ``until``; ``hero``
+    always holds the latest stored state.
+    """
+    if until is None:
+        until = datetime.now(timezone.utc)
+    deadline = None if budget is None else time.monotonic() + budget
+    caught_up = False
+    with metrics.count_queries(metrics.sampled()) as queries:
+        for _ in range(retries):
+            diary = Diary(hero, fast_forward=True)
+            try:
+                diary.process_story(until, deadline)
+            except StaleHeroError:
+                hero.refresh_from_db()
+            else:
+                caught_up = diary.caught_up
+                break
+    if queries is not None:
+        metrics.RUN_QUERIES.observe(queries.count)
+    return caught_up
 
 
 class CheckHero(View):
+    PAGE_SIZE = 20
+    ADVANCE_AFTER = timedelta(minutes=1)
+    FRAGMENT_TIMEOUT = 60 * 60  # fragments are keyed on the hero version, so they never go stale
+
     def get(self, request, hero_id):
         hero = get_object_or_404(models.Hero, pk=hero_id)
-        diary = Diary(hero)
-        diary.process_story()
-        return render(request, "hero_page.html", context={"hero": hero, "diary": diary})
+        now = datetime.now(timezone.utc)
+        if settings.DIARY_ADVANCE_IN_REQUEST:
+            # The budget caps the request; whatever is left is caught up in the background.
+            if not advance(hero, until=now, budget=settings.DIARY_ADVANCE_BUDGET):
+                self.request_advance(hero)
+        elif now - hero.last_action > self.ADVANCE_AFTER:
+            self.request_advance(hero)
+        not_modified = self.not_modified(request, hero)
+        if not_modified is not None:
+            return not_modified
+        entries = list(self.get_entries(hero, request.GET.get("before", "")))
+        return self.render_page(request, hero, lambda: load_equipments(hero), entries)
+
+    def request_advance(self, hero: models.Hero):
+        # Polling clients would otherwise queue one catch-up per request.
+        if cache.add(f"advance-hero:{hero.id}", True, timeout=self.ADVANCE_AFTER.total_seconds()):
+            from diary.dispatch import get_dispatcher  # redis and rq are only loaded once a job is sent
+
+            dispatcher = get_dispatcher()
+            dispatcher.dispatch("diary.tasks.advance_hero", hero.id, queue_name=dispatcher.hero_queue(hero.id, "high"))
+
+    @staticmethod
+    def validators(hero: models.Hero):
+        """ETag and Last-Modified of the page; every flush bumps the version and moves last_action.
+
+        Runs in which no action fit do not flush, so polling an idle hero keeps getting 304s.
+        """
+        last_modified = int(hero.last_action.timestamp())
+        return f'"{hero.id}.{hero.version}.{last_modified}"', last_modified
+
+    def set_validators(self, response, hero: models.Hero):
+        etag, last_modified = self.validators(hero)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def not_modified(self, request, hero: models.Hero) -> Optional[HttpResponse]:
+        """The 304 (or 412) answer to a conditional request, before any entry is loaded or rendered."""
+        etag, last_modified = self.validators(hero)
+        response = get_conditional_response(request, etag, last_modified, self.set_validators(HttpResponse(), hero))
+        return response if response.status_code != 200 else None
+
+    def get_entries(self, hero: models.Hero, before: str):
+        """Newest diary entries first, paginated by the (offset, id) key of the last entry shown."""
+        entries = hero.diary_entries.order_by("-offset", "-id")
+        offset, _, pk = before.partition(".")
+        if offset.isdigit() and pk.isdigit():
+            entries = entries.filter(Q(offset__lt=int(offset)) | Q(offset=int(offset), id__lt=int(pk)))
+        return entries[: self.PAGE_SIZE + 1]
+
+    def render_page(self, request, hero: models.Hero, load_equipments, entries: list):
+        """``load_equipments`` is only called when the cached equipment fragment is missing."""
+        before = None
+        if len(entries) > self.PAGE_SIZE:
+            last = entries[self.PAGE_SIZE - 1]
+            entries, before = entries[: self.PAGE_SIZE], f"{last.offset}.{last.id}"
+        context = {
+            "hero": hero,
+            "equipments": lambda: [equipment for _, equipment in sorted(load_equipments().items())],
+            "entries": entries,
+            "before": before,
+            "fragment_timeout": self.FRAGMENT_TIMEOUT,
+        }
+        with metrics.timed(metrics.RENDER_SECONDS, "hero_page.html", enabled=metrics.sampled()):
+            return self.set_validators(render(request, "hero_page.html", context=context), hero)
+
+
+_simulation_pool = None
+
+
+def get_simulation_pool() -> ThreadPoolExecutor:
+    global _simulation_pool
+    if _simulation_pool is None:
+        _simulation_pool = ThreadPoolExecutor(settings.DIARY_SIMULATION_WORKERS, thread_name_prefix="diary-simulation")
+    return _simulation_pool
+
+
+def run_simulation(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def simulate(func, *args, **kwargs):
+    """Run the blocking ``func`` on the bounded simulation pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_simulation_pool(), run_simulation, func, args, kwargs)
+
+
+class AsyncStartView(StartView):
+    async def get(self, request):
+        heroes = [hero async for hero in self.get_heroes(request.GET.get("after", ""))]
+        return self.render_page(request, heroes, get_summaries(heroes[: self.PAGE_SIZE]))
+
+
+class AsyncCheckHero(CheckHero):
+    async def get(self, request, hero_id):
+        hero = await aget_object_or_404(models.Hero, pk=hero_id)
+        now = datetime.now(timezone.utc)
+        if settings.DIARY_ADVANCE_IN_REQUEST:
+            if not await simulate(advance, hero, until=now, budget=settings.DIARY_ADVANCE_BUDGET):
+                await sync_to_async(self.request_advance)(hero)
+        elif now - hero.last_action > self.ADVANCE_AFTER:
+            await sync_to_async(self.request_advance)(hero)
+        not_modified = self.not_modified(request, hero)
+        if not_modified is not None:
+            return not_modified
+        entries = [entry async for entry in self.get_entries(hero, request.GET.get("before", ""))]
+        equipments = await aload_equipments(hero)
+        return self.render_page(request, hero, lambda: equipments, entries)
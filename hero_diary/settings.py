@@ -13,6 +13,7 @@ import logging
 import os
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+import dj_database_url
 import django_heroku
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "diary.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -76,7 +78,42 @@ WSGI_APPLICATION = "hero_diary.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(BASE_DIR, "db.sqlite3"),}}
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        # WAL lets pages read while a worker writes; NORMAL syncs at checkpoints instead of every commit.
+        "OPTIONS": {"init_command": "PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL"},
+        # A file instead of the shared in-memory database, so concurrency tests wait on locks.
+        "TEST": {"NAME": os.path.join(BASE_DIR, "test_db.sqlite3")},
+    }
+}
+if "DATABASE_URL" in os.environ:
+    DATABASES["default"] = dj_database_url.config(ssl_require=os.getenv("DATABASE_SSL_REQUIRE", "1") == "1")
+    if "CI" in os.environ:
+        DATABASES["default"]["TEST"] = DATABASES["default"]
+# Web and worker processes keep their connection for this many seconds and check it before reusing it.
+# Under ASGI every request queries from a thread of its own that would keep an idle connection, so
+# async views connect per request unless DATABASE_CONN_MAX_AGE says otherwise.
+DATABASES["default"]["CONN_MAX_AGE"] = int(
+    os.getenv("DATABASE_CONN_MAX_AGE", "0" if os.getenv("DIARY_ASYNC_VIEWS") == "1" else "600")
+)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+# Behind pgbouncer in transaction pooling mode a cursor cannot outlive its transaction.
+if os.getenv("DATABASE_PGBOUNCER") == "1":
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Leaderboards and catch-up throttling are shared between web and worker processes only with a shared backend.
+
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+if os.getenv("REDIS_CACHE_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_CACHE_URL"),
+    }
 
 
 # Password validation
@@ -108,5 +145,33 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = "/static/"
-CONN_MAX_AGE = 0
-django_heroku.settings(locals())
+
+# Heroes are advanced by scheduler.py; set to True to catch up inside CheckHero instead.
+DIARY_ADVANCE_IN_REQUEST = False
+# Seconds between scheduler.py ticks; a tick skips heroes that acted within the last one.
+DIARY_TICK_SECONDS = int(os.getenv("HERO_TICK_SECONDS", "60"))
+# Seconds of simulation CheckHero may spend when advancing in the request; the rest is queued.
+DIARY_ADVANCE_BUDGET = 0.05
+# Async views (used by hero_diary.asgi) run catch-ups on a pool of this many threads.
+DIARY_ASYNC_VIEWS = os.getenv("DIARY_ASYNC_VIEWS") == "1"
+DIARY_SIMULATION_WORKERS = 4
+# Share of diary runs and requests whose timings and query counts are recorded, see diary.metrics.
+DIARY_METRICS_SAMPLE_RATE = float(os.getenv("DIARY_METRICS_SAMPLE_RATE", "0.1"))
+
+# Where diary runs store equipment: "rows" (one Equipment row per slot) or "packed" (one field on
+# Hero). Heroes move to the configured storage on their next run, or all at once with pack_equipment.
+DIARY_EQUIPMENT_STORAGE = os.getenv("DIARY_EQUIPMENT_STORAGE", "rows")
+
+# Background jobs from web requests: "batching" (default), "redis" or "local" (in-process threads).
+JOB_DISPATCHER = os.getenv("JOB_DISPATCHER", "batching")
+JOB_DISPATCH_TIMEOUT = 0.5
+JOB_DISPATCH_MAX_CONNECTIONS = 10
+
+# Where processes add up their metrics: "redis" (the job queue's Redis, the default when one is
+# configured) or "local" (each process serves its own). /metrics answers staff and requests with
+# "Authorization: Bearer <DIARY_METRICS_TOKEN>".
+DIARY_METRICS_STORE = os.getenv("DIARY_METRICS_STORE", "redis" if os.getenv("REDISTOGO_URL") else "local")
+DIARY_METRICS_TOKEN = os.getenv("DIARY_METRICS_TOKEN")
+
+# DATABASES is configured above, django_heroku would replace it with its own connection settings.
+django_heroku.settings(locals(), databases=False)
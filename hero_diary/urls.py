@@ -1,11 +1,19 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 
-from diary.views import CheckHero, CreateHero, StartView
+from diary.metrics import metrics_view
+from diary.views import AsyncCheckHero, AsyncStartView, CheckHero, CreateHero, CreateHeroes, Leaderboard, StartView
+
+if settings.DIARY_ASYNC_VIEWS:
+    StartView, CheckHero = AsyncStartView, AsyncCheckHero
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("create_hero", CreateHero.as_view(), name="create-hero"),
+    path("create_heroes", CreateHeroes.as_view(), name="create-heroes"),
     path("view_hero/<int:hero_id>", CheckHero.as_view(), name="hero"),
+    path("leaderboard", Leaderboard.as_view(), name="leaderboard"),
+    path("metrics", metrics_view, name="metrics"),
     path("", StartView.as_view(), name="index"),
 ]
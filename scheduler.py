@@ -0,0 +1,37 @@
+import logging
+import os
+import time
+
+import django
+import redis
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hero_diary.settings")
+django.setup()
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from rq import Queue
+
+from diary.shards import load_ring
+from diary.tasks import schedule_advance_heroes
+from worker import conn
+
+logger = logging.getLogger("scheduler")
+
+
+def tick(queue: Queue) -> bool:
+    """Queue this tick's hero ranges; a Redis or database outage only costs the tick."""
+    close_old_connections()
+    try:
+        schedule_advance_heroes(queue, ring=load_ring(queue.connection))
+    except (redis.RedisError, DatabaseError):
+        logger.exception("Could not schedule hero ranges, retrying next tick")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    queue = Queue("low", connection=conn)
+    while True:
+        tick(queue)
+        time.sleep(settings.DIARY_TICK_SECONDS)
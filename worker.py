@@ -1,7 +1,9 @@
+import argparse
 import os
 
 import redis
-from rq import Worker, Queue, Connection
+from django.db import close_old_connections
+from rq import SimpleWorker, Worker, Queue, Connection
 
 listen = ['high', 'default', 'low']
 
@@ -9,8 +11,37 @@ redis_url = os.getenv('REDISTOGO_URL', 'redis://localhost:6379')
 
 conn = redis.from_url(redis_url)
 
+
+class DiaryWorker(SimpleWorker):
+    """Runs jobs in the worker process instead of a fork per job, so the database connection outlives
+    the job. Around each job it is checked and recycled like around a web request."""
+
+    def execute_job(self, job, queue):
+        close_old_connections()
+        try:
+            return super().execute_job(job, queue)
+        finally:
+            close_old_connections()
+
+
 if __name__ == '__main__':
+    import django
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shard', help="serve only this shard's hero queues, see diary.shards")
+    parser.add_argument('--fork', action='store_true', help='run every job in a forked process (reconnects per job)')
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hero_diary.settings")
+    django.setup()
+    name = None
+    if args.shard:
+        from diary.shards import PRIORITIES, queue_name
+
+        listen = [queue_name(args.shard, priority) for priority in PRIORITIES] + ['default']
+        name = f'shard-{args.shard}.{os.getpid()}'
     with Connection(conn):
-        worker = Worker(map(Queue, listen))
+        worker_class = Worker if args.fork else DiaryWorker
+        worker = worker_class(map(Queue, listen), name=name)
         worker.work()
 